@@ -0,0 +1,101 @@
+import hashlib
+import json
+import re
+import threading
+
+from profiles import config_version, write_config
+
+# Bump whenever ACTION_PROMPT_TEMPLATE changes, so code generated from the old prompt is not served
+ACTION_PROMPT_VERSION = 1
+ACTION_PROMPT_TEMPLATE = """
+            You are a highly skilled Python developer. Your task is to generate a **fully functional Python function** that {action}.
+
+            ### Strict Requirements:
+            - The function **must** collect user input dynamically using `input()`.
+            - **Output must be Python code only** – **DO NOT** include explanations, comments, or placeholder text.
+            - The function **must be executable without modification**.
+            - **Ensure the code is properly formatted and indented.**
+            - **DO NOT** include example inputs/outputs or explanations.
+            - **DO NOT** include import statments the function alone is enough.
+            """
+DEFAULT_NEXT_STEP_OPTIONS = {
+    "1": "Send an Email",
+    "2": "Create a Jira Ticket",
+    "3": "Generate a Report",
+    "4": "Update Source",
+}
+
+
+def action_prompt(action):
+    return ACTION_PROMPT_TEMPLATE.format(action=action.lower())
+
+
+def extract_input_fields(code):
+    """Extracts input fields from the generated code using regex."""
+    input_fields = re.findall(r'input\s*\(\s*["\'](.*?)["\']\s*\)', code)
+    return input_fields
+
+
+class ActionCodeCache:
+    """Generated next-step action code and its input fields, one JSON file per profile.
+
+    Entries are keyed by option id and remember a fingerprint of the option's
+    text, the prompt version and the model; an entry whose fingerprint no longer
+    matches is never served. The file is re-read when another process rewrites it.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self._lock = threading.Lock()
+        self._files = {}
+
+    def fingerprint(self, action):
+        return hashlib.sha256(f"{ACTION_PROMPT_VERSION}\0{self.model}\0{action}".encode()).hexdigest()
+
+    def _entries(self, path):
+        version = config_version(path)
+        cached = self._files.get(path)
+        if cached is None or cached[0] != version:
+            entries = {}
+            if version is not None:
+                try:
+                    with open(path) as file:
+                        entries = json.load(file)
+                except ValueError:
+                    pass  # a damaged cache file is simply rebuilt
+            cached = self._files[path] = (version, entries)
+        return cached[1]
+
+    def _write(self, path, entries):
+        write_config(path, entries)
+        self._files[path] = (config_version(path), entries)
+
+    def get(self, path, option, action):
+        """Return {"generated_code", "input_fields"} for the option, or None if it has to be generated."""
+        with self._lock:
+            entry = self._entries(path).get(option)
+        if entry is None or entry["fingerprint"] != self.fingerprint(action):
+            return None
+        return entry
+
+    def put(self, path, option, action, generated_code):
+        entry = {
+            "fingerprint": self.fingerprint(action),
+            "generated_code": generated_code,
+            "input_fields": extract_input_fields(generated_code),
+        }
+        with self._lock:
+            entries = dict(self._entries(path))
+            entries[option] = entry
+            self._write(path, entries)
+        return entry
+
+    def retain(self, path, options):
+        """Drop the entries that do not match ``options`` any more; returns the option ids left to generate."""
+        with self._lock:
+            entries = self._entries(path)
+            current = {option: entry for option, entry in entries.items()
+                       if option in options and entry["fingerprint"] == self.fingerprint(options[option])}
+            if current != entries:
+                self._write(path, current)
+        return [option for option in options if option not in current]
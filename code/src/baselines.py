@@ -0,0 +1,186 @@
+import os
+import threading
+import warnings
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from keys import key_strings
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+ALL_ROWS_KEY = "__all__"
+
+
+class BaselineStore:
+    """Per-key historical baselines of reconciliation differences, kept in a Parquet file.
+
+    There is one row per key tuple and metric (difference column) holding the running
+    count, mean and sum of squared deviations (so std can be derived), plus the last
+    ``last_n`` observed values, most recent first. ``update`` folds a new run in with
+    Chan's parallel variance formula, so history is never rescanned, and ``lookup``
+    attaches the baselines to a frame with a single vectorized merge.
+    """
+
+    def __init__(self, path, key_columns, last_n=5):
+        self.path = path
+        self.key_columns = list(key_columns) or [ALL_ROWS_KEY]
+        self.last_n = last_n
+        self.last_columns = [f"last_{i + 1}" for i in range(last_n)]
+        self._lock = threading.Lock()
+        self._cache = None
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return pd.DataFrame(columns=self.key_columns + ["metric", "count", "mean", "m2"] + self.last_columns)
+        version = os.stat(self.path).st_mtime_ns
+        if self._cache is None or self._cache[0] != version:
+            self._cache = (version, pd.read_parquet(self.path))
+        return self._cache[1]
+
+    def _keys(self, dataframe):
+        if self.key_columns == [ALL_ROWS_KEY]:
+            return pd.DataFrame({ALL_ROWS_KEY: np.full(len(dataframe), "*")}, index=dataframe.index)
+        return key_strings(dataframe[self.key_columns])
+
+    def _aggregate(self, dataframe, metric):
+        data = self._keys(dataframe)
+        data["value"] = pd.to_numeric(dataframe[metric], errors="coerce")
+        data = data.dropna(subset=["value"])
+        grouped = data.groupby(self.key_columns, sort=False)["value"]
+
+        stats = pd.DataFrame({"count": grouped.count(), "mean": grouped.mean()})
+        stats["m2"] = grouped.var(ddof=0) * stats["count"]
+
+        recent = data.groupby(self.key_columns, sort=False).tail(self.last_n)
+        position = recent.groupby(self.key_columns, sort=False).cumcount(ascending=False)
+        last_values = recent.set_index(self.key_columns + [position.rename("position")])["value"].unstack()
+        last_values = last_values.reindex(columns=range(self.last_n))
+        last_values.columns = self.last_columns
+
+        return stats.join(last_values).reset_index().assign(metric=metric)
+
+    def aggregate(self, dataframe, metrics):
+        """Baseline statistics of ``dataframe`` alone, per key and metric column, in the stored layout."""
+        metrics = [metric for metric in metrics if metric in dataframe.columns]
+        if dataframe.empty or not metrics:
+            return None
+        return pd.concat([self._aggregate(dataframe, metric) for metric in metrics], ignore_index=True)
+
+    def combine(self, new, old):
+        """Fold the aggregates ``new`` into the older ``old`` ones; ``new``'s recent values come first."""
+        merged = new.merge(old, on=self.key_columns + ["metric"], how="outer", suffixes=("_new", "_old"))
+
+        n_new = merged["count_new"].fillna(0).to_numpy(dtype=np.float64)
+        n_old = merged["count_old"].fillna(0).to_numpy(dtype=np.float64)
+        mean_new = merged["mean_new"].fillna(0).to_numpy(dtype=np.float64)
+        mean_old = merged["mean_old"].fillna(0).to_numpy(dtype=np.float64)
+        count = n_new + n_old
+        delta = mean_new - mean_old
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(count > 0, mean_old + delta * n_new / count, np.nan)
+            m2 = (merged["m2_new"].fillna(0).to_numpy(dtype=np.float64)
+                  + merged["m2_old"].fillna(0).to_numpy(dtype=np.float64)
+                  + np.where(count > 0, delta ** 2 * n_new * n_old / count, 0))
+
+        # Newest values first, then the stored ones; NaN gaps are squeezed out before truncating to last_n
+        recent = np.hstack([
+            merged[[f"{col}_new" for col in self.last_columns]].to_numpy(dtype=np.float64),
+            merged[[f"{col}_old" for col in self.last_columns]].to_numpy(dtype=np.float64),
+        ])
+        order = np.argsort(np.isnan(recent), axis=1, kind="stable")
+        recent = np.take_along_axis(recent, order, axis=1)[:, :self.last_n]
+
+        result = merged[self.key_columns + ["metric"]].copy()
+        result["count"] = count.astype(np.int64)
+        result["mean"] = mean
+        result["m2"] = m2
+        result[self.last_columns] = recent
+        return result
+
+    def apply(self, aggregates):
+        """Fold ``aggregates`` (from ``aggregate`` or ``combine``) into the stored baselines."""
+        if aggregates is None or aggregates.empty:
+            return
+        with self._locked():
+            result = self.combine(aggregates, self.load())
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            temp_path = f"{self.path}.tmp"
+            result.to_parquet(temp_path, index=False)
+            os.replace(temp_path, self.path)
+
+    def update(self, dataframe, metrics):
+        """Fold the rows of ``dataframe`` into the stored baselines for each metric column."""
+        self.apply(self.aggregate(dataframe, metrics))
+
+    def lookup(self, dataframe, metric):
+        """Return baselines aligned to ``dataframe``'s rows.
+
+        The columns are count, mean, std, rolling_mean, median and mad; the last three
+        are computed over the stored recent values.
+        """
+        stored = self.load()
+        stored = stored[stored["metric"] == metric]
+        recent = stored[self.last_columns].to_numpy(dtype=np.float64)
+        with warnings.catch_warnings():
+            # Keys without recent values give all-NaN rows, which should simply stay NaN
+            warnings.simplefilter("ignore", RuntimeWarning)
+            median = np.nanmedian(recent, axis=1)
+            mad = np.nanmedian(np.abs(recent - median[:, None]), axis=1)
+        baselines = pd.DataFrame({
+            **{col: stored[col].astype(str) for col in self.key_columns},
+            "count": stored["count"],
+            "mean": stored["mean"],
+            "std": np.sqrt(stored["m2"].astype(np.float64) / stored["count"].clip(lower=1)),
+            "rolling_mean": stored[self.last_columns].astype(np.float64).mean(axis=1),
+            "median": median,
+            "mad": mad,
+        }, index=stored.index)
+        keys = self._keys(dataframe).reset_index(drop=True)
+        result = keys.merge(baselines, on=self.key_columns, how="left")
+        result.index = dataframe.index
+        return result[["count", "mean", "std", "rolling_mean", "median", "mad"]]
+
+    @contextmanager
+    def _locked(self):
+        # The thread lock covers this process; flock covers job workers and other server processes
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            with open(f"{self.path}.lock", "w") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class PendingBaselines:
+    """The baseline updates of one run, combined in memory and written with a single ``flush``.
+
+    Every update rewrites the store under its lock, so a chunked run adds each
+    chunk here and applies them all once it has finished. Chunks may go to
+    different stores (as when a file lacks a key column); each is kept apart.
+    """
+
+    def __init__(self):
+        self.aggregates = {}
+
+    def update(self, store, dataframe, metrics):
+        aggregates = store.aggregate(dataframe, metrics)
+        if aggregates is not None:
+            pending = self.aggregates.get(store)
+            self.aggregates[store] = aggregates if pending is None else store.combine(aggregates, pending)
+
+    def flush(self):
+        aggregates, self.aggregates = self.aggregates, {}
+        for store, store_aggregates in aggregates.items():
+            store.apply(store_aggregates)
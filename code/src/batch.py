@@ -0,0 +1,214 @@
+"""Reconcile many input files in parallel from the command line.
+
+Each file is reconciled chunk by chunk in a process pool whose workers load the
+anomaly model once, and its rows are written as Parquet partitioned by source
+file, one directory per file:
+
+    <output>/anomalous/source=<file>/part-00000.parquet
+    <output>/matched/source=<file>/part-00000.parquet
+
+A per-file summary is printed at the end and saved as <output>/summary.json.
+
+The run reads and updates its own copy of the model's baselines,
+<output>/baselines.parquet, so a backfill does not shift the baselines the
+server uses; pass --baselines to update another store, or
+--no-baseline-update to only read. The --llm-concurrency comment requests
+in flight are split between the workers.
+
+    python batch.py "inputs/*.csv" --config config.json --output out --workers 8
+"""
+import argparse
+import concurrent.futures
+import dataclasses
+import glob
+import json
+import os
+import re
+import shutil
+import time
+
+from ingest import DEFAULT_CHUNK_SIZE, EXTENSION_FORMATS
+from jobs import job_context
+from profiles import ReconciliationProfile
+from results import write_result_part
+
+_profile = None
+_update_baselines = True
+
+
+def expand_inputs(patterns):
+    """Input files named by ``patterns``: files, directories (their supported files) or glob patterns."""
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = [os.path.join(pattern, name) for name in os.listdir(pattern)
+                       if os.path.splitext(name)[1].lower() in EXTENSION_FORMATS]
+        else:
+            matches = glob.glob(pattern)
+        paths += sorted(path for path in matches if os.path.isfile(path))
+    return list(dict.fromkeys(paths))
+
+
+def partition_names(paths):
+    """A unique, filesystem-safe partition value per input file, based on its name."""
+    names = {}
+    used = set()
+    for path in paths:
+        base = re.sub(r"[^A-Za-z0-9_.-]", "_", os.path.splitext(os.path.basename(path))[0]) or "input"
+        name, suffix = base, 2
+        while name in used:
+            name, suffix = f"{base}-{suffix}", suffix + 1
+        used.add(name)
+        names[path] = name
+    return names
+
+
+def init_worker(profile, update_baselines=True, llm_concurrency=None):
+    """Process-pool initializer: load the profile's model once for every file this worker handles."""
+    global _profile, _update_baselines
+    import backend
+
+    _profile = profile
+    _update_baselines = update_baselines
+    if llm_concurrency:
+        backend.llm_client.concurrency = llm_concurrency
+    if backend.get_compact_forest(profile.model_path) is None:
+        backend.model_registry.get(profile.model_path)
+
+
+def reconcile_file(path, partition, output_dir, chunk_size):
+    import backend
+
+    result = {"file": path, "partition": partition, "status": "ok", "rows": 0, "anomalous": 0, "matched": 0,
+              "stage_counts": {}}
+    directories = {kind: os.path.join(output_dir, kind, f"source={partition}") for kind in ("anomalous", "matched")}
+    parts = {kind: 0 for kind in directories}
+    start = time.perf_counter()
+    try:
+        with backend.metrics.run("batch_file", profile=_profile.name, filename=path) as run:
+            for directory in directories.values():
+                # A rerun replaces the file's earlier output instead of adding to it
+                shutil.rmtree(directory, ignore_errors=True)
+                os.makedirs(directory)
+            chunks = backend.iter_input_chunks(path, path, chunk_size, backend.get_input_columns(_profile))
+            for chunk, anomalous in iter_reconciled(backend, chunks, result["stage_counts"]):
+                for kind, rows in (("anomalous", chunk[anomalous]), ("matched", chunk[~anomalous])):
+                    if not rows.empty:
+                        write_result_part(directories[kind], parts[kind], rows)
+                        parts[kind] += 1
+                        result[kind] += len(rows)
+                result["rows"] += len(chunk)
+            run.update(processed_count=result["rows"])
+        result["stages"] = run["stages"]
+    except Exception as e:
+        result.update(status="failed", error=str(e))
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def iter_reconciled(backend, chunks, stage_counts):
+    """Like backend.iter_reconciled_chunks, but yields each reconciled chunk with its anomaly mask and
+    leaves the matched records to the Parquet output instead of the database."""
+    pending_baselines = backend.PendingBaselines()
+    chunks = iter(chunks)
+    while True:
+        with backend.metrics.stage("ingest"):
+            chunk = next(chunks, None)
+        if chunk is None:
+            if _update_baselines:
+                with backend.metrics.stage("baseline_update"):
+                    pending_baselines.flush()
+            return
+        anomalous = backend.reconcile_frame(chunk, _profile, stage_counts, pending_baselines)
+        yield chunk, anomalous
+
+
+def run_batch(paths, profile, output_dir, workers=None, chunk_size=DEFAULT_CHUNK_SIZE, update_baselines=True,
+              llm_concurrency=None):
+    """Reconcile ``paths`` across a process pool; returns one result dict per file, in input order.
+
+    ``llm_concurrency`` caps the comment requests in flight across all workers, each getting a share.
+    """
+    partitions = partition_names(paths)
+    workers = max(1, min(workers or os.cpu_count() or 1, len(paths)))
+    worker_concurrency = max(1, llm_concurrency // workers) if llm_concurrency else None
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=job_context(),
+                                                initializer=init_worker,
+                                                initargs=(profile, update_baselines, worker_concurrency)) as executor:
+        futures = [executor.submit(reconcile_file, path, partitions[path], output_dir, chunk_size) for path in paths]
+        results = []
+        for future in futures:
+            result = future.result()
+            print(f"{result['status']:>6}  {result['file']}  {result['seconds']:.2f}s")
+            results.append(result)
+    return results
+
+
+def print_summary(results, seconds):
+    width = max([len(result["file"]) for result in results] + [4])
+    print(f"\n{'file':<{width}}{'status':>8}{'rows':>12}{'anomalous':>11}{'matched':>12}{'seconds':>9}{'rows/s':>11}")
+    for result in results:
+        rate = result["rows"] / result["seconds"] if result["seconds"] else 0
+        print(f"{result['file']:<{width}}{result['status']:>8}{result['rows']:>12,}{result['anomalous']:>11,}"
+              f"{result['matched']:>12,}{result['seconds']:>9.2f}{rate:>11,.0f}")
+        if result["status"] != "ok":
+            print(f"  error: {result['error']}")
+    rows = sum(result["rows"] for result in results)
+    failed = sum(result["status"] != "ok" for result in results)
+    print(f"\n{len(results)} files ({failed} failed), {rows:,} rows in {seconds:.2f}s wall time, "
+          f"{rows / seconds if seconds else 0:,.0f} rows/s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("inputs", nargs="+", help="input files, directories or glob patterns")
+    parser.add_argument("--config", required=True, help="reconciliation config JSON")
+    parser.add_argument("--output", required=True, help="directory for the partitioned Parquet output")
+    parser.add_argument("--model", default=None, help="anomaly model artifact (default: the backend's MODEL_PATH)")
+    parser.add_argument("--profile", default="batch", help="profile name recorded in the run log")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--baselines", default=None,
+                        help="baseline store to read and update (default: <output>/baselines.parquet, "
+                             "started from a copy of the model's baselines)")
+    parser.add_argument("--no-baseline-update", action="store_true", help="read the baselines without updating them")
+    parser.add_argument("--llm-concurrency", type=int, default=None,
+                        help="comment requests in flight across all workers (default: the backend's LLM_CONCURRENCY)")
+    args = parser.parse_args(argv)
+
+    paths = expand_inputs(args.inputs)
+    if not paths:
+        parser.error("no input files matched")
+    with open(args.config) as file:
+        config = json.load(file)
+    if args.model is None:
+        from backend import MODEL_PATH
+        args.model = MODEL_PATH
+    if args.llm_concurrency is None:
+        from backend import LLM_CONCURRENCY
+        args.llm_concurrency = LLM_CONCURRENCY
+    profile = ReconciliationProfile.from_config(args.profile, config, args.model)
+    if args.baselines is None:
+        args.baselines = os.path.join(args.output, "baselines.parquet")
+        # Every run starts from the model's baselines, so a rerun does not count its files twice
+        os.makedirs(args.output, exist_ok=True)
+        if os.path.exists(profile.baseline_path):
+            shutil.copyfile(profile.baseline_path, args.baselines)
+        elif os.path.exists(args.baselines):
+            os.remove(args.baselines)
+    profile = dataclasses.replace(profile, baseline_file=args.baselines)
+
+    start = time.perf_counter()
+    results = run_batch(paths, profile, args.output, args.workers, args.chunk_size, not args.no_baseline_update,
+                        args.llm_concurrency)
+    seconds = time.perf_counter() - start
+    print_summary(results, seconds)
+
+    os.makedirs(args.output, exist_ok=True)
+    with open(os.path.join(args.output, "summary.json"), "w") as file:
+        json.dump({"seconds": seconds, "files": results}, file, indent=2, default=str)
+    return 1 if any(result["status"] != "ok" for result in results) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,92 @@
+import hashlib
+import sqlite3
+import threading
+import time
+
+
+class CommentCache:
+    """Persistent cache of generated LLM comments, keyed on prompt hash and model name.
+
+    Entries older than ``ttl_seconds`` expire, and once there are more than
+    ``max_entries`` the least recently used ones are evicted.
+    """
+
+    def __init__(self, path, max_entries=100_000, ttl_seconds=30 * 24 * 3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._connection = None
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def prompt_key(prompt, model):
+        return hashlib.sha256(f"{model}\0{prompt}".encode("utf-8")).hexdigest()
+
+    def _connect(self):
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS comments ("
+                " key TEXT PRIMARY KEY, model TEXT NOT NULL, comment TEXT NOT NULL,"
+                " created_at REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._connection.execute("CREATE INDEX IF NOT EXISTS comments_last_used ON comments (last_used)")
+            self._connection.commit()
+        return self._connection
+
+    def get_many(self, prompts, model):
+        """Return {prompt: comment} for the prompts that have a live cache entry."""
+        keys = {self.prompt_key(prompt, model): prompt for prompt in prompts}
+        now = time.time()
+        found = {}
+        with self._lock:
+            connection = self._connect()
+            key_list = list(keys)
+            # Stay under SQLite's bound-parameter limit
+            for start in range(0, len(key_list), 500):
+                batch = key_list[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = connection.execute(
+                    f"SELECT key, comment FROM comments WHERE key IN ({placeholders}) AND created_at >= ?",
+                    batch + [now - self.ttl_seconds],
+                ).fetchall()
+                for key, comment in rows:
+                    found[keys[key]] = comment
+            connection.executemany(
+                "UPDATE comments SET last_used = ? WHERE key = ?",
+                [(now, self.prompt_key(prompt, model)) for prompt in found],
+            )
+            connection.commit()
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, comments, model):
+        """Store {prompt: comment} and evict expired and least recently used entries."""
+        now = time.time()
+        with self._lock:
+            connection = self._connect()
+            connection.executemany(
+                "INSERT OR REPLACE INTO comments (key, model, comment, created_at, last_used) VALUES (?, ?, ?, ?, ?)",
+                [(self.prompt_key(prompt, model), model, comment, now, now) for prompt, comment in comments.items()],
+            )
+            connection.execute("DELETE FROM comments WHERE created_at < ?", (now - self.ttl_seconds,))
+            connection.execute(
+                "DELETE FROM comments WHERE key IN ("
+                " SELECT key FROM comments ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            connection.commit()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            entries = self._connect().execute("SELECT COUNT(*) FROM comments").fetchone()[0]
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": entries,
+            }
@@ -1,6 +1,7 @@
 import streamlit as st
 import requests
 import json
+import time
 import pandas as pd
 
 
@@ -12,6 +13,10 @@ CHAT_SELECT_API = f"{BASE_URL}/chat/select"
 CHAT_EXECUTE_API = f"{BASE_URL}/chat/execute"
 LOAD_CONFIG_API = f"{BASE_URL}/load/config"
 TRAIN_MODEL_API = f"{BASE_URL}/train/model"
+JOBS_API = f"{BASE_URL}/jobs"
+RESULTS_API = f"{BASE_URL}/results"
+RESULTS_PAGE_SIZE = 500
+JOB_WAIT_TIMEOUT = 2 * 3600  # seconds to poll a job before giving up on it
 
 # Streamlit Page Config
 st.set_page_config(page_title="Reconciliation Chatbot", layout="wide")
@@ -39,9 +44,88 @@ if "input_fields" not in st.session_state:
     st.session_state.input_fields = {}
 if "api_called" not in st.session_state:
     st.session_state.api_called = False  # Track API call status
+if "results" not in st.session_state:
+    st.session_state.results = None  # Result id and anomalous count of the last reconciliation
 
 
 
+def wait_for_job(job_id, label):
+    """Poll a backend job until it finishes, showing its progress. Returns the final status.
+
+    Raises requests.exceptions.Timeout if the job has not finished after JOB_WAIT_TIMEOUT seconds.
+    """
+    progress = st.empty()
+    deadline = time.monotonic() + JOB_WAIT_TIMEOUT
+    while True:
+        response = requests.get(f"{JOBS_API}/{job_id}", timeout=30)
+        response.raise_for_status()
+        status = response.json()
+        progress.info(f"{label}: {status['status']} – {status.get('processed_count', 0):,} rows processed, "
+                      f"{status.get('anomalous_count', 0):,} anomalous so far")
+        if status["status"] in ("completed", "failed"):
+            progress.empty()
+            return status
+        if time.monotonic() > deadline:
+            progress.empty()
+            raise requests.exceptions.Timeout(f"{label} job {job_id} did not finish within {JOB_WAIT_TIMEOUT} seconds.")
+        time.sleep(1)
+
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def fetch_results_page(result_id, page, filters, sort, order):
+    """One page of a stored result set; cached so reruns of the page don't refetch it."""
+    response = requests.get(f"{RESULTS_API}/{result_id}", params={
+        "page": page, "page_size": RESULTS_PAGE_SIZE, "filter": list(filters), "sort": sort or None, "order": order,
+    })
+    response.raise_for_status()
+    return response.json()
+
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def fetch_results_file(result_id, file_format, filters):
+    response = requests.get(f"{RESULTS_API}/{result_id}/download",
+                            params={"format": file_format, "filter": list(filters)})
+    response.raise_for_status()
+    return response.content
+
+
+def display_results():
+    """Browse the last reconciliation's anomalous records page by page."""
+    results = st.session_state.results
+    if not results:
+        return
+    result_id = results["result_id"]
+    st.subheader(f"Anomalous Records ({results['anomalous_count']:,})")
+
+    columns = st.columns(4)
+    filter_column = columns[0].text_input("Filter column", key="results_filter_column")
+    filter_value = columns[1].text_input("Filter value", key="results_filter_value")
+    sort = columns[2].text_input("Sort by column", key="results_sort")
+    order = columns[3].selectbox("Order", ["asc", "desc"], key="results_order")
+    filters = (f"{filter_column}:{filter_value}",) if filter_column else ()
+
+    page = st.number_input("Page", min_value=1, value=1, step=1, key="results_page")
+    try:
+        result = fetch_results_page(result_id, int(page), filters, sort, order)
+    except requests.exceptions.HTTPError as e:
+        st.warning(e.response.json().get("error", "Could not load results."))
+        return
+    except requests.exceptions.RequestException:
+        st.warning("Backend service error.")
+        return
+
+    st.dataframe(pd.DataFrame(result["data"], columns=result["columns"]), use_container_width=True)
+    st.caption(f"Page {result['page']} of {max(result['page_count'], 1)} – {result['total_count']:,} matching records")
+
+    file_format = st.radio("Download format", ["parquet", "arrow"], horizontal=True, key="results_format")
+    if st.button("Prepare download"):
+        try:
+            st.download_button("Download anomalous records", fetch_results_file(result_id, file_format, filters),
+                               file_name=f"anomalies-{result_id}.{file_format}")
+        except requests.exceptions.RequestException:
+            st.warning("Backend service error.")
+
+
 def display_chat():
     """Display chat messages."""
     for entry in st.session_state.chat_history:
@@ -126,16 +210,17 @@ def display_chat():
     # Training Model Upload Section
     if st.session_state.show_upload_fields:
         st.subheader("Upload Training Files")
-        train_data_file = st.file_uploader("Upload training dataset", type=["csv", "xlsx"], key="train_data_file")
+        train_data_file = st.file_uploader("Upload training dataset", type=["csv", "xlsx", "parquet", "arrow"], key="train_data_file")
         if st.button("Train Model"):
             if train_data_file:
-                files = {"historical_file": (train_data_file.name, train_data_file,
-                                             "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")}
+                files = {"historical_file": (train_data_file.name, train_data_file, train_data_file.type)}
                 with st.spinner("Training model... Please wait."):
                     try:
-                        response = requests.post(TRAIN_MODEL_API, files=files)
+                        response = requests.post(f"{JOBS_API}/train", files=files)
                         response.raise_for_status()
-                        result = response.json()
+                        result = wait_for_job(response.json()["job_id"], "Training")
+                        if result["status"] == "failed":
+                            raise requests.exceptions.RequestException(result.get("error"))
 
                         # Append response to chat history
                         formatted_result = json.dumps(result, indent=2)
@@ -158,7 +243,9 @@ def display_chat():
     # Reconciliation Upload Section
     if st.session_state.show_reconcile_fields:
         st.subheader("Upload Reconciliation Files")
-        current_data_file = st.file_uploader("Current Data File", type=["csv", "xlsx"], key="current_data_file")
+        current_data_file = st.file_uploader("Current Data File", type=["csv", "xlsx", "parquet", "arrow"], key="current_data_file")
+        counterpart_data_file = st.file_uploader("Counterpart Data File (optional, joined on the key columns)",
+                                                 type=["csv", "xlsx", "parquet", "arrow"], key="counterpart_data_file")
 
         if st.button("Start Reconciliation") and not st.session_state.api_called:
             st.session_state.api_called = True  # Mark API as called
@@ -168,20 +255,25 @@ def display_chat():
         st.session_state.api_called = False  # Reset API call flag
         if current_data_file:
             files = {
-                "file": (current_data_file.name, current_data_file, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+                "file": (current_data_file.name, current_data_file, current_data_file.type),
             }
+            if counterpart_data_file:
+                files["counterpart_file"] = (counterpart_data_file.name, counterpart_data_file, counterpart_data_file.type)
             with st.spinner("Processing reconciliation..."):
                 try:
-                    response = requests.post(RECONCILE_API, files=files)
+                    response = requests.post(f"{JOBS_API}/reconcile", files=files)
                     response.raise_for_status()
-                    result = response.json()
-                    message = f"Reconciliation complete.\n\n```json\n{result}\n```"
-                    st.session_state.chat_history.append({"role": "system", "content": message})
+                    job_id = response.json()["job_id"]
+                    status = wait_for_job(job_id, "Reconciliation")
+                    if status["status"] == "failed":
+                        raise requests.exceptions.RequestException(status.get("error"))
                     st.session_state.show_reconcile_fields = False
-                    if isinstance(result, dict) and "anomalous_records" in result:
-                        df = pd.DataFrame(result["anomalous_records"])  # Convert anomalous records to DataFrame
-                        table_str = df.to_markdown(index=False)  # Convert DataFrame to markdown table
-                        message = f"### Reconciliation Results (Anomalous Count: {result.get('anomalous_count', 0)})\n\n```\n{table_str}\n```"
+                    # Records stay on the server; the results section below fetches them a page at a time
+                    result = {"result_id": job_id, "anomalous_count": status.get("anomalous_count", 0)}
+                    st.session_state.results = result
+                    if result["anomalous_count"]:
+                        message = (f"Reconciliation complete: {status.get('processed_count', 0):,} rows processed, "
+                                   f"{result['anomalous_count']:,} anomalous records (see below).")
                     else:
                         message = "Reconciliation complete, but no anomalous records found."
 
@@ -226,12 +318,14 @@ def handle_chat(user_message):
 # Display chat messages
 if st.button("Clear Chat"):
     st.session_state.chat_history = []
+    st.session_state.results = None
     st.session_state.show_config_upload = False
     st.session_state.show_upload_fields = False
     st.rerun()
 
 # Display chat history
 display_chat()
+display_results()
 
 
 # Get user input
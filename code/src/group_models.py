@@ -0,0 +1,71 @@
+import concurrent.futures
+
+import numpy as np
+from sklearn.ensemble import IsolationForest
+from sklearn.preprocessing import StandardScaler
+
+from jobs import job_context
+from keys import key_strings
+
+
+def fit_isolation_forest(features):
+    scaler = StandardScaler()
+    scaled_features = scaler.fit_transform(features)
+    model = IsolationForest(contamination=0.05, random_state=42)
+    model.fit(scaled_features)
+    return model, scaler
+
+
+def group_row_indices(dataframe, group_columns):
+    """Map each group key (a tuple of strings) to the positional row indices in that group."""
+    keys = key_strings(dataframe[list(group_columns)])
+    indices = keys.groupby(list(group_columns), sort=False).indices
+    return {key if isinstance(key, tuple) else (key,): rows for key, rows in indices.items()}
+
+
+class GroupedAnomalyModel:
+    """One IsolationForest per group of ``group_columns``, with a global fallback.
+
+    Saved as a single artifact: the group keys map to positions in a flat list of
+    (model, scaler) pairs. Groups with fewer than ``min_group_size`` training rows
+    do not get their own model and are scored by the global one, as are groups
+    that were not present at training time.
+    """
+
+    def __init__(self, group_columns, global_model, group_keys, group_models):
+        self.group_columns = tuple(group_columns)
+        self.global_model = global_model
+        self.group_index = {key: position for position, key in enumerate(group_keys)}
+        self.group_models = list(group_models)
+
+    @classmethod
+    def fit(cls, dataframe, feature_columns, group_columns, min_group_size=50, max_workers=None):
+        features = dataframe[feature_columns].to_numpy()
+        global_model = fit_isolation_forest(features)
+
+        groups = {
+            key: rows for key, rows in group_row_indices(dataframe, group_columns).items()
+            if len(rows) >= min_group_size
+        }
+        group_keys = list(groups)
+        if len(group_keys) > 1 and max_workers != 1:
+            # Training can run inside a threaded web worker, which must never be forked
+            with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers, mp_context=job_context()) as executor:
+                group_models = list(executor.map(fit_isolation_forest, (features[groups[key]] for key in group_keys)))
+        else:
+            group_models = [fit_isolation_forest(features[groups[key]]) for key in group_keys]
+
+        return cls(group_columns, global_model, group_keys, group_models)
+
+    def predict(self, dataframe, feature_columns):
+        """Return +1 / -1 per row like IsolationForest.predict, scoring each group in one batch."""
+        features = dataframe[feature_columns].to_numpy()
+        predictions = np.ones(len(dataframe), dtype=np.int64)
+        for key, rows in group_row_indices(dataframe, self.group_columns).items():
+            position = self.group_index.get(key)
+            model, scaler = self.global_model if position is None else self.group_models[position]
+            predictions[rows] = model.predict(scaler.transform(features[rows]))
+        return predictions
+
+    def stats(self):
+        return {"group_columns": list(self.group_columns), "group_models": len(self.group_models)}
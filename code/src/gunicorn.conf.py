@@ -0,0 +1,43 @@
+"""gunicorn settings for the backend: ``gunicorn -c gunicorn.conf.py wsgi:app``.
+
+Every setting can be overridden through the environment. Workers are recycled
+gracefully with ``kill -HUP <master pid>``; a retrained model does not need a
+reload, because each worker's model registry notices the new artifact on disk
+and swaps it in on the next request.
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get("BACKEND_BIND", "0.0.0.0:5000")
+# Reconciliation is CPU-bound, so one process per core; a few threads cover I/O-bound requests
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+# The backend divides its JOB_WORKERS background job processes between the workers
+os.environ["WEB_CONCURRENCY"] = str(workers)
+worker_class = "gthread"
+threads = int(os.environ.get("BACKEND_THREADS", 4))
+
+# Load the app and its models in the master so the workers share those pages
+preload_app = True
+
+# Large uploads and full reconciliations can take minutes
+timeout = int(os.environ.get("BACKEND_TIMEOUT", 300))
+graceful_timeout = int(os.environ.get("BACKEND_GRACEFUL_TIMEOUT", 120))
+keepalive = 5
+
+# Recycle workers now and then to bound fragmentation; the jitter keeps them from restarting together
+max_requests = int(os.environ.get("BACKEND_MAX_REQUESTS", 1000))
+max_requests_jitter = max_requests // 10
+
+# Request bodies are capped by MAX_UPLOAD_MB in backend.py; these only bound the request line and headers
+limit_request_line = 8190
+limit_request_fields = 100
+
+accesslog = "-"
+errorlog = "-"
+
+
+def post_fork(server, worker):
+    import backend
+
+    # Connections opened in the master must not be shared with the forked workers
+    backend.engine.dispose(close=False)
@@ -0,0 +1,241 @@
+import csv
+import io
+import os
+import shutil
+import tempfile
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+
+DEFAULT_CHUNK_SIZE = 100_000
+# The streaming CSV reader infers column types from its first block, so blocks are large
+CSV_BLOCK_SIZE = 64 * 1024 * 1024
+
+EXTENSION_FORMATS = {
+    ".csv": "csv",
+    ".txt": "csv",
+    ".parquet": "parquet",
+    ".pq": "parquet",
+    ".arrow": "arrow",
+    ".feather": "arrow",
+    ".ipc": "arrow",
+    ".xlsx": "excel",
+    ".xlsm": "excel",
+}
+
+
+def detect_format(filename, head=b""):
+    """Work out the input format from the file's magic bytes, falling back to its extension."""
+    if head.startswith(b"PAR1"):
+        return "parquet"
+    if head.startswith(b"ARROW1") or head.startswith(b"\xff\xff\xff\xff"):
+        return "arrow"
+    if head.startswith(b"PK\x03\x04"):
+        return "excel"
+
+    extension = os.path.splitext(filename or "")[1].lower()
+    if extension in EXTENSION_FORMATS:
+        return EXTENSION_FORMATS[extension]
+    raise ValueError(f"Unsupported input file type: '{extension or filename}'.")
+
+
+def resolve_columns(available, wanted):
+    """Map the wanted (stripped) column names onto the file's raw header names.
+
+    Returns None, meaning "read every column", when there is nothing to project.
+    """
+    if not wanted:
+        return None
+    wanted = {col.strip() for col in wanted}
+    resolved = [col for col in available if str(col).strip() in wanted]
+    return resolved or None
+
+
+def read_input(source, filename=None, columns=None):
+    """Read a whole input file into a DataFrame.
+
+    ``source`` is a local path or a seekable file object. Local Arrow and Parquet
+    files are memory-mapped, and only ``columns`` are materialized when given.
+    """
+    is_path = isinstance(source, (str, os.PathLike))
+    file_format = detect_format(filename or (source if is_path else ""), _peek(source))
+
+    if file_format == "excel":
+        if columns:
+            wanted = {col.strip() for col in columns}
+            return pd.read_excel(source, usecols=lambda col: str(col).strip() in wanted)
+        return pd.read_excel(source)
+
+    if file_format == "csv":
+        header = _read_csv_header(source)
+        convert_options = pacsv.ConvertOptions(include_columns=resolve_columns(header, columns))
+        table = pacsv.read_csv(pa.memory_map(source) if is_path else source, convert_options=convert_options)
+    elif file_format == "parquet":
+        parquet_file = pq.ParquetFile(source, memory_map=is_path)
+        table = parquet_file.read(columns=resolve_columns(parquet_file.schema_arrow.names, columns))
+    else:
+        reader = _open_arrow(pa.memory_map(source) if is_path else source)
+        table = reader.read_all()
+        selected = resolve_columns(table.column_names, columns)
+        if selected:
+            table = table.select(selected)
+
+    # split_blocks lets null-free numeric columns reference the Arrow buffers (and the mmap) directly
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+
+def read_upload(file, columns=None):
+    """Stage an uploaded file on local disk and read it with read_input."""
+    path = stage_upload(file)
+    try:
+        return read_input(path, file.filename, columns)
+    finally:
+        os.remove(path)
+
+
+def iter_input_chunks(file, filename, chunk_size=DEFAULT_CHUNK_SIZE, columns=None):
+    """Yield the input file as DataFrames of at most ``chunk_size`` rows."""
+    file_format = detect_format(filename, _peek(file))
+    if file_format == "csv":
+        yield from _iter_csv_chunks(file, chunk_size, columns)
+    elif file_format == "parquet":
+        yield from _iter_parquet_chunks(file, chunk_size, columns)
+    elif file_format == "arrow":
+        yield from _iter_arrow_chunks(file, chunk_size, columns)
+    else:
+        yield from _iter_excel_chunks(file, chunk_size, columns)
+
+
+def stage_upload(file):
+    """Copy an uploaded file to a local temp file so it can be read after the request ends."""
+    suffix = os.path.splitext(file.filename or "")[1]
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as staged:
+        shutil.copyfileobj(file.stream, staged)
+    return staged.name
+
+
+def remove_staged(path):
+    """Delete a staged upload; it may already be gone."""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def iter_staged_chunks(path, chunk_size=DEFAULT_CHUNK_SIZE, columns=None):
+    """Like iter_input_chunks, but reads a staged file and deletes it once exhausted or closed.
+
+    A generator that is never started never runs its cleanup, so callers that may
+    drop it unstarted must call remove_staged themselves as well.
+    """
+    try:
+        yield from iter_input_chunks(path, path, chunk_size, columns)
+    finally:
+        remove_staged(path)
+
+
+def _peek(source, size=8):
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            return f.read(size)
+    position = source.tell()
+    head = source.read(size)
+    source.seek(position)
+    return head if isinstance(head, bytes) else head.encode()
+
+
+def _read_csv_header(source):
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            line = f.readline()
+    else:
+        position = source.tell()
+        line = source.readline()
+        source.seek(position)
+    if isinstance(line, bytes):
+        line = line.decode("utf-8-sig")
+    return next(csv.reader(io.StringIO(line)), [])
+
+
+def _open_arrow(source):
+    try:
+        return ipc.open_file(source)
+    except pa.ArrowInvalid:
+        source.seek(0)
+        return ipc.open_stream(source)
+
+
+def _rechunk(batches, chunk_size):
+    """Regroup record batches of any size into DataFrames of ``chunk_size`` rows (the last may be shorter)."""
+    pending, rows = [], 0
+    for batch in batches:
+        while batch.num_rows:
+            take = min(chunk_size - rows, batch.num_rows)
+            pending.append(batch.slice(0, take))
+            rows += take
+            batch = batch.slice(take)
+            if rows == chunk_size:
+                yield pa.Table.from_batches(pending).to_pandas()
+                pending, rows = [], 0
+    if rows:
+        yield pa.Table.from_batches(pending).to_pandas()
+
+
+def _iter_csv_chunks(file, chunk_size, columns):
+    # The same pyarrow parser as read_input, so a file gets the same dtypes whether or not it is chunked
+    is_path = isinstance(file, (str, os.PathLike))
+    convert_options = pacsv.ConvertOptions(include_columns=resolve_columns(_read_csv_header(file), columns))
+    reader = pacsv.open_csv(pa.memory_map(file) if is_path else file, convert_options=convert_options,
+                            read_options=pacsv.ReadOptions(block_size=CSV_BLOCK_SIZE))
+    yield from _rechunk(reader, chunk_size)
+
+
+def _iter_parquet_chunks(file, chunk_size, columns):
+    parquet_file = pq.ParquetFile(file)
+    selected = resolve_columns(parquet_file.schema_arrow.names, columns)
+    for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=selected):
+        yield batch.to_pandas()
+
+
+def _iter_arrow_chunks(file, chunk_size, columns):
+    source = pa.memory_map(file) if isinstance(file, (str, os.PathLike)) else file
+    reader = _open_arrow(source)
+    selected = resolve_columns(reader.schema.names, columns)
+    batches = (
+        (reader.get_batch(i) for i in range(reader.num_record_batches))
+        if isinstance(reader, ipc.RecordBatchFileReader) else reader
+    )
+    for batch in batches:
+        if selected:
+            batch = batch.select(selected)
+        for offset in range(0, batch.num_rows, chunk_size):
+            yield batch.slice(offset, chunk_size).to_pandas()
+
+
+def _iter_excel_chunks(file, chunk_size, columns):
+    from openpyxl import load_workbook
+
+    # read_only mode parses the sheet lazily instead of building the whole workbook in memory
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        header = [str(col) if col is not None else f"Unnamed: {i}" for i, col in enumerate(header)]
+        selected = resolve_columns(header, columns) or header
+        indexes = [header.index(col) for col in selected]
+
+        buffer = []
+        for row in rows:
+            buffer.append([row[i] if i < len(row) else None for i in indexes])
+            if len(buffer) >= chunk_size:
+                yield pd.DataFrame(buffer, columns=selected)
+                buffer = []
+        if buffer:
+            yield pd.DataFrame(buffer, columns=selected)
+    finally:
+        workbook.close()
@@ -0,0 +1,229 @@
+import concurrent.futures
+import json
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+
+from results import RESULT_ID_PATTERN, CacheIndex, evict_directories, query_results, write_result_part
+
+
+class JobManager:
+    """Runs reconciliation and training jobs in a process pool.
+
+    Every job gets a directory under ``jobs_dir`` holding ``status.json`` (state,
+    progress and partial counts, rewritten atomically as the job runs) and, for
+    reconciliations, the anomalous records as numbered Parquet parts so they can
+    be served page by page after the job finishes.
+
+    A reconciliation submitted with a ``cache_key`` is recorded under that key
+    once it completes, so ``lookup`` can hand an identical submission the
+    finished job instead. Finished jobs are evicted by age and total size like
+    the ResultStore's sets.
+
+    Job processes come from a fork server rather than being forked from the
+    (threaded) web worker, so they never inherit its writer thread, database
+    pool or SQLite connection; ``run_job`` imports the backend afresh instead.
+    A job whose process dies (out of memory, say) is marked failed, and the
+    pool it broke is replaced for the next submission.
+    """
+
+    def __init__(self, jobs_dir, max_workers=None, max_age_seconds=24 * 3600, max_bytes=None):
+        self.jobs_dir = jobs_dir
+        self.max_workers = max_workers
+        self.max_age_seconds = max_age_seconds
+        self.max_bytes = max_bytes
+        self.index = CacheIndex(index_directory(jobs_dir))
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.max_workers,
+                                                                        mp_context=job_context())
+            return self._executor
+
+    def _discard_executor(self, executor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False)
+
+    def job_dir(self, job_id):
+        return os.path.join(self.jobs_dir, job_id)
+
+    def submit(self, kind, input_path, filename, profile, chunk_size, counterpart_path=None, cache_key=None):
+        self.purge()
+        job_id = uuid.uuid4().hex
+        os.makedirs(self.job_dir(job_id))
+        write_status(self.job_dir(job_id), {
+            "job_id": job_id,
+            "kind": kind,
+            "status": "queued",
+            "filename": filename,
+            "profile": profile.name,
+            "submitted_at": time.time(),
+            "processed_count": 0,
+            "anomalous_count": 0,
+            "cache_key": cache_key,
+        })
+        job_args = (run_job, self.job_dir(job_id), kind, input_path, profile, chunk_size, counterpart_path)
+        executor = self._get_executor()
+        try:
+            future = executor.submit(*job_args)
+        except concurrent.futures.process.BrokenProcessPool:
+            # An earlier job's process died and took the pool with it
+            self._discard_executor(executor)
+            executor = self._get_executor()
+            future = executor.submit(*job_args)
+        future.add_done_callback(lambda future: self._job_done(future, executor, job_args[1:]))
+        return job_id
+
+    def _job_done(self, future, executor, job_args):
+        """Future callback: fail a job whose process died before it could record the outcome itself."""
+        if future.cancelled() or future.exception() is None:
+            return
+        if isinstance(future.exception(), concurrent.futures.process.BrokenProcessPool):
+            self._discard_executor(executor)
+        job_dir, _, input_path, _, _, counterpart_path = job_args
+        fail_unfinished_job(job_dir, f"The job process stopped unexpectedly: {future.exception()}")
+        for path in (input_path, counterpart_path):
+            if path and os.path.exists(path):
+                os.remove(path)
+
+    def status(self, job_id):
+        try:
+            return read_status(self.job_dir(job_id))
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def lookup(self, cache_key):
+        """Return the id of a completed job submitted under ``cache_key``, or None."""
+        job_id = self.index.get(cache_key)
+        status = self.status(job_id) if job_id else None
+        if status is None or status["status"] != "completed":
+            if job_id is not None and status is None:
+                self.index.discard(cache_key)  # the job has been evicted
+            return None
+        os.utime(self.job_dir(job_id))  # mark it used, for eviction
+        return job_id
+
+    def purge(self):
+        """Evict finished jobs; queued and running ones are never touched."""
+        if not os.path.isdir(self.jobs_dir):
+            return
+        finished = []
+        for entry in os.scandir(self.jobs_dir):
+            if entry.is_dir() and RESULT_ID_PATTERN.match(entry.name):
+                status = self.status(entry.name)
+                if status is not None and status["status"] in ("completed", "failed"):
+                    finished.append(entry.path)
+        evict_directories(finished, self.max_age_seconds, self.max_bytes)
+        self.index.purge(self.max_age_seconds)
+
+    def result_paths(self, job_id):
+        """Parquet parts of a finished reconciliation's anomalous records, or None if it has not finished."""
+        status = self.status(job_id)
+        if status is None or status["status"] != "completed":
+            return None
+        return [os.path.join(self.job_dir(job_id), part["file"]) for part in status.get("result_parts", [])]
+
+    def results_page(self, job_id, page, page_size, filters=None, sort_by=None, descending=False):
+        """Return one page (1-based) of a finished reconciliation's anomalous records."""
+        paths = self.result_paths(job_id)
+        if paths is None:
+            return None
+        return query_results(paths, filters, sort_by, descending, page, page_size)[0]
+
+
+def job_context():
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+def fail_unfinished_job(job_dir, error):
+    try:
+        status = read_status(job_dir)
+    except (FileNotFoundError, ValueError):
+        return
+    if status["status"] in ("queued", "running"):
+        status.update({"status": "failed", "error": error, "finished_at": time.time()})
+        write_status(job_dir, status)
+
+
+def index_directory(jobs_dir):
+    return os.path.join(jobs_dir, "index")
+
+
+def write_status(job_dir, status):
+    temp_path = os.path.join(job_dir, "status.json.tmp")
+    with open(temp_path, "w") as f:
+        json.dump(status, f, default=str)
+    os.replace(temp_path, os.path.join(job_dir, "status.json"))
+
+
+def read_status(job_dir):
+    with open(os.path.join(job_dir, "status.json")) as f:
+        return json.load(f)
+
+
+def run_job(job_dir, kind, input_path, profile, chunk_size, counterpart_path=None):
+    """Process-pool entry point; all state goes through the job directory."""
+    import backend
+
+    status = read_status(job_dir)
+    status.update({"status": "running", "started_at": time.time()})
+    write_status(job_dir, status)
+    try:
+        with backend.metrics.run(f"job_{kind}", job_id=status["job_id"], profile=profile.name) as run:
+            if kind == "reconcile":
+                _run_reconcile(backend, job_dir, status, input_path, profile, chunk_size, counterpart_path)
+            else:
+                _run_train(backend, status, input_path, profile)
+            run.update(processed_count=status["processed_count"], stage_counts=status.get("stage_counts"))
+        status.update({"status": "completed", "finished_at": time.time()})
+        # A result holding fallback comments is not reused, so a rerun can get the missed comments
+        if kind == "reconcile" and status.get("cache_key") and not status["stage_counts"].get("comment_fallbacks"):
+            CacheIndex(index_directory(os.path.dirname(job_dir))).put(status["cache_key"], status["job_id"])
+    except Exception as e:
+        status.update({"status": "failed", "error": str(e), "finished_at": time.time()})
+    finally:
+        for path in (input_path, counterpart_path):
+            if path and os.path.exists(path):
+                os.remove(path)
+    write_status(job_dir, status)
+
+
+def _run_reconcile(backend, job_dir, status, input_path, profile, chunk_size, counterpart_path=None):
+    status["result_parts"] = []
+    status["stage_counts"] = {}
+    columns = backend.get_input_columns(profile)
+    if counterpart_path:
+        # Both extracts have to be read whole for the join; the joined frame is then reconciled chunk by chunk
+        with backend.metrics.stage("ingest"):
+            left = backend.read_input(input_path, columns=columns)
+            right = backend.read_input(counterpart_path, columns=columns)
+        chunks = backend.iter_frame_chunks(backend.join_frames(left, right, profile), chunk_size)
+        del left, right
+    else:
+        chunks = backend.iter_input_chunks(input_path, input_path, chunk_size, columns)
+    for chunk_count, anomalous_chunk in backend.iter_reconciled_chunks(chunks, profile, status["stage_counts"]):
+        if not anomalous_chunk.empty:
+            status["result_parts"].append(write_result_part(job_dir, len(status["result_parts"]), anomalous_chunk))
+        status["processed_count"] += chunk_count
+        status["anomalous_count"] += len(anomalous_chunk)
+        status["chunks_done"] = status.get("chunks_done", 0) + 1
+        write_status(job_dir, status)
+    # The job only counts as done once its matched records have reached the database
+    backend.record_writer.flush()
+
+
+def _run_train(backend, status, input_path, profile):
+    historical_dataframe = backend.read_input(input_path, columns=backend.get_input_columns(profile))
+    status["processed_count"] = len(historical_dataframe)
+    if not historical_dataframe.empty:
+        anomaly_columns = backend.get_anamoly_columns(historical_dataframe, profile)
+        backend.train_anomaly_model(historical_dataframe, anomaly_columns, profile.model_path,
+                                    profile.plan.group_columns)
@@ -0,0 +1,114 @@
+import concurrent.futures
+import os
+
+import numpy as np
+import pandas as pd
+
+from keys import normalize_key_column
+
+JOIN_STATUS_COLUMN = "Join Status"
+MATCHED = "Matched"
+# Below this many rows per side a single merge beats splitting the work up
+MIN_PARTITIONED_ROWS = 200_000
+
+
+class DuplicateKeysError(ValueError):
+    """A side of a join has more than one row for some key, so its rows cannot be paired up."""
+
+
+def join_labels(names):
+    """Join Status labels for rows found on both sides, only on the left and only on the right."""
+    left_name, right_name = names
+    return MATCHED, f"Missing in {right_name}", f"Missing in {left_name}"
+
+
+def prepare_sides(left, right, key_columns, names):
+    """Strip headers, check the keys and prefix the value columns both sides share with their side's name."""
+    left.columns = left.columns.str.strip()
+    right.columns = right.columns.str.strip()
+    key_columns = list(key_columns)
+    if not key_columns:
+        raise ValueError("Joining two sources needs 'key_columns' in the config.")
+    for name, side in zip(names, (left, right)):
+        missing = [col for col in key_columns if col not in side.columns]
+        if missing:
+            raise ValueError(f"Key columns {missing} are missing from the {name} source.")
+
+    shared = (set(left.columns) & set(right.columns)) - set(key_columns)
+    left = left.rename(columns={col: f"{names[0]} {col}".strip() for col in shared})
+    right = right.rename(columns={col: f"{names[1]} {col}".strip() for col in shared})
+
+    for col in key_columns:
+        left[col], right[col] = align_keys(left[col], right[col])
+    for name, side in zip(names, (left, right)):
+        duplicated = side.duplicated(key_columns, keep=False)
+        if duplicated.any():
+            examples = side.loc[duplicated, key_columns].drop_duplicates().head(5).to_dict("records")
+            raise DuplicateKeysError(
+                f"The {name} source has {int(duplicated.sum())} rows sharing a key with another row "
+                f"(for example {examples}); each key must appear once per source."
+            )
+    return left, right
+
+
+def align_keys(left, right):
+    """Give one key column of each side the same dtype, so equal keys hash and compare equal.
+
+    Integer keys next to a blank one arrive as floats (1001.0), so whole-number floats
+    become Int64. Keys that are numeric on both sides, even if one side read them as
+    text, are compared as numbers; only genuinely mixed keys fall back to stripped strings.
+    """
+    left, right = normalize_key_column(left), normalize_key_column(right)
+    if left.dtype == right.dtype:
+        return left, right
+    numeric = [pd.to_numeric(side, errors="coerce") for side in (left, right)]
+    if all(number.notna().sum() == side.notna().sum() for number, side in zip(numeric, (left, right))):
+        left, right = (normalize_key_column(number.astype(np.float64)) for number in numeric)
+        if left.dtype == right.dtype:
+            return left, right
+        return left.astype(np.float64), right.astype(np.float64)
+    return (normalize_key_column(side).astype(str).str.strip() for side in (left, right))
+
+
+def partition(dataframe, key_columns, partitions):
+    """Split ``dataframe`` into ``partitions`` frames by a hash of its key columns."""
+    ids = pd.util.hash_pandas_object(dataframe[key_columns], index=False).to_numpy() % np.uint64(partitions)
+    order = np.argsort(ids, kind="stable")
+    bounds = np.searchsorted(ids[order], np.arange(1, partitions, dtype=np.uint64))
+    return [dataframe.take(rows) for rows in np.split(order, bounds)]
+
+
+def _merge(left, right, key_columns, labels):
+    joined = left.merge(right, on=key_columns, how="outer", sort=False, indicator=JOIN_STATUS_COLUMN)
+    joined[JOIN_STATUS_COLUMN] = joined[JOIN_STATUS_COLUMN].cat.rename_categories(
+        {"both": labels[0], "left_only": labels[1], "right_only": labels[2]}
+    ).cat.set_categories(labels)
+    return joined
+
+
+def join_sources(left, right, key_columns, names=("Left", "Right"), partitions=None, max_workers=None):
+    """Full outer join of two extracts on ``key_columns`` into one frame for reconciliation.
+
+    Value columns found on both sides are prefixed with the side's name (the
+    config's ``db_columns``), so "Balance" becomes "GL Balance" and "iHub
+    Balance" as the difference logic expects. The "Join Status" column holds
+    "Matched" or "Missing in <side>" for one-sided rows. A key that appears
+    twice on one side raises DuplicateKeysError rather than pairing every copy
+    with every copy on the other side.
+
+    Large inputs are split into ``partitions`` by a hash of the keys. Matching
+    keys always land in the same partition, so each partition pair is joined
+    on its own, in parallel threads.
+    """
+    key_columns = list(key_columns)
+    left, right = prepare_sides(left, right, key_columns, names)
+    labels = join_labels(names)
+
+    partitions = partitions or os.cpu_count() or 1
+    if partitions == 1 or max(len(left), len(right)) < MIN_PARTITIONED_ROWS:
+        return _merge(left, right, key_columns, labels)
+
+    pairs = zip(partition(left, key_columns, partitions), partition(right, key_columns, partitions))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers or partitions) as executor:
+        parts = list(executor.map(lambda pair: _merge(pair[0], pair[1], key_columns, labels), pairs))
+    return pd.concat(parts, ignore_index=True)
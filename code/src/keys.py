@@ -0,0 +1,24 @@
+import numpy as np
+import pandas as pd
+
+
+def normalize_key_column(values):
+    """Give a key column one canonical dtype, whatever else was in the chunk it came from.
+
+    Integer keys read alongside a blank one come back as floats (1001.0), so float
+    columns holding only whole numbers become nullable Int64, and whole-number floats
+    mixed into object columns become ints.
+    """
+    if pd.api.types.is_float_dtype(values.dtype):
+        present = values.dropna().to_numpy(dtype=np.float64)
+        if np.isfinite(present).all() and (present == np.floor(present)).all():
+            return values.astype("Int64")
+    elif values.dtype == object:
+        return values.map(lambda value: int(value) if isinstance(value, float) and value.is_integer() else value)
+    return values
+
+
+def key_strings(dataframe):
+    """``dataframe``'s columns as strings, after normalize_key_column; the form group and baseline keys take."""
+    return pd.DataFrame({col: normalize_key_column(dataframe[col]).astype(str) for col in dataframe.columns},
+                        index=dataframe.index)
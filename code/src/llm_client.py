@@ -0,0 +1,178 @@
+import asyncio
+import json
+import random
+import time
+
+import ollama
+
+# Rough prompt-size estimate; good enough to keep a batch inside the context window
+CHARS_PER_TOKEN = 4
+BATCH_INSTRUCTIONS = (
+    "Answer each of the numbered requests in the JSON object below independently. Reply with one JSON "
+    "object that maps every request number to its answer as a string, and nothing else.\n"
+)
+
+
+def batch_prompt(prompts):
+    """One prompt asking for a JSON object of answers keyed "1", "2", ... in the order of ``prompts``."""
+    return BATCH_INSTRUCTIONS + json.dumps({str(number): prompt for number, prompt in enumerate(prompts, 1)})
+
+
+def batch_schema(size):
+    """JSON schema for the reply to a batch of ``size`` prompts, used as Ollama's structured output format."""
+    keys = [str(number) for number in range(1, size + 1)]
+    return {"type": "object", "properties": {key: {"type": "string"} for key in keys}, "required": keys}
+
+
+def parse_batch_reply(reply, size):
+    """Split a batch reply into {position: answer}; missing, empty or non-string answers are left out."""
+    try:
+        answers = json.loads(reply) if reply is not None else {}
+    except ValueError:
+        return {}
+    if not isinstance(answers, dict):
+        return {}
+    parsed = {}
+    for position in range(size):
+        answer = answers.get(str(position + 1))
+        if isinstance(answer, str) and answer.strip():
+            parsed[position] = answer.strip()
+    return parsed
+
+
+class AsyncLLMClient:
+    """Bounded-concurrency Ollama chat client with per-call deadlines and retries.
+
+    At most ``concurrency`` requests are in flight at once. Each attempt is cut off
+    after ``call_timeout`` seconds and failed attempts are retried up to ``retries``
+    times with jittered exponential backoff. ``chat_many`` also enforces a
+    ``total_budget`` for the whole batch; prompts without an answer by then come
+    back as None so the caller can substitute a fallback.
+
+    With ``max_batch_size`` above 1, ``chat_batched`` packs many prompts into
+    each request and asks for a JSON object of answers, sized to fit
+    ``context_length`` tokens together with ``answer_tokens`` per answer.
+    """
+
+    def __init__(self, model, host=None, concurrency=5, call_timeout=30.0, retries=2,
+                 backoff=0.5, total_budget=120.0, max_batch_size=1, context_length=8192, answer_tokens=150):
+        self.model = model
+        self.host = host
+        self.concurrency = concurrency
+        self.call_timeout = call_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.total_budget = total_budget
+        self.max_batch_size = max_batch_size
+        self.context_length = context_length
+        self.answer_tokens = answer_tokens
+
+    def chat(self, prompt, **options):
+        """Send one prompt and return the reply text, raising if every attempt fails."""
+        return asyncio.run(self._with_client(lambda client: self._chat(client, prompt, options)))
+
+    def chat_many(self, prompts, **options):
+        """Send many prompts and return replies in order, with None for any that failed."""
+        if not prompts:
+            return []
+        return asyncio.run(self._with_client(lambda client: self._chat_many(client, list(prompts), options)))
+
+    def chat_batched(self, prompts, **options):
+        """Like chat_many, but answers several prompts per request.
+
+        Rows whose answer is missing or invalid are sent again, in batches half
+        the size, for up to ``retries`` more rounds (unless a whole round failed
+        to get any reply); those still unanswered come back as None.
+        """
+        if not prompts:
+            return []
+        if self.max_batch_size <= 1:
+            return self.chat_many(prompts, **options)
+        return asyncio.run(self._with_client(lambda client: self._chat_batched(client, list(prompts), options)))
+
+    def batch_size(self, prompts):
+        """How many of ``prompts`` fit in one request, judged by the longest of them."""
+        instruction_tokens = len(BATCH_INSTRUCTIONS) // CHARS_PER_TOKEN
+        row_tokens = max(len(prompt) for prompt in prompts) // CHARS_PER_TOKEN + self.answer_tokens + 8
+        fitting = (self.context_length - instruction_tokens) // row_tokens
+        return max(1, min(self.max_batch_size, fitting))
+
+    async def _with_client(self, run):
+        """Await ``run(client)`` with one Ollama client, closing its connection pool afterwards."""
+        client = ollama.AsyncClient(host=self.host)
+        try:
+            return await run(client)
+        finally:
+            await client.close()
+
+    async def _chat(self, client, prompt, options):
+        deadline = time.monotonic() + self.total_budget
+        return await self._chat_with_retry(client, prompt, deadline, options)
+
+    async def _chat_batched(self, client, prompts, options):
+        deadline = time.monotonic() + self.total_budget
+        results = [None] * len(prompts)
+        pending = list(range(len(prompts)))
+        size = self.batch_size(prompts)
+        options = {**options, "options": {**options.get("options", {}), "num_ctx": self.context_length}}
+        for _ in range(self.retries + 1):
+            if not pending or time.monotonic() >= deadline:
+                break
+            batches = [pending[start:start + size] for start in range(0, len(pending), size)]
+            batch_prompts = [batch_prompt([prompts[index] for index in batch]) for batch in batches]
+            formats = [batch_schema(len(batch)) for batch in batches]
+            replies = await self._chat_many(client, batch_prompts, options, deadline, formats)
+            if all(reply is None for reply in replies):
+                break  # every request failed even after its own retries; the model is unreachable
+
+            pending = []
+            for batch, reply in zip(batches, replies):
+                answers = parse_batch_reply(reply, len(batch))
+                for position, index in enumerate(batch):
+                    if position in answers:
+                        results[index] = answers[position]
+                    else:
+                        pending.append(index)
+            # Long batches are the likeliest to be cut off or garbled, so the retries get smaller ones
+            size = max(1, size // 2)
+        return results
+
+    async def _chat_many(self, client, prompts, options, deadline=None, formats=None):
+        deadline = deadline or time.monotonic() + self.total_budget
+        results = [None] * len(prompts)
+        # A fixed set of workers pulling from a queue bounds both concurrency and the number of live tasks
+        queue = asyncio.Queue()
+        for item in enumerate(prompts):
+            queue.put_nowait(item)
+
+        async def worker():
+            while not queue.empty():
+                index, prompt = queue.get_nowait()
+                prompt_options = options if formats is None else {**options, "format": formats[index]}
+                try:
+                    results[index] = await self._chat_with_retry(client, prompt, deadline, prompt_options)
+                except Exception as e:
+                    print(f"Comment generation failed: {e!r}")
+
+        workers = [asyncio.create_task(worker()) for _ in range(min(self.concurrency, len(prompts)))]
+        _, pending = await asyncio.wait(workers, timeout=max(deadline - time.monotonic(), 0))
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        return results
+
+    async def _chat_with_retry(self, client, prompt, deadline, options):
+        for attempt in range(self.retries + 1):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError("LLM latency budget exhausted.")
+            try:
+                response = await asyncio.wait_for(
+                    client.chat(model=self.model, messages=[{"role": "user", "content": prompt}], **options),
+                    timeout=min(self.call_timeout, remaining),
+                )
+                return response["message"]["content"].strip()
+            except Exception:
+                if attempt == self.retries:
+                    raise
+                await asyncio.sleep(random.uniform(0, self.backoff * 2 ** attempt))
@@ -0,0 +1,307 @@
+import contextvars
+import cProfile
+import glob
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+import uuid
+import weakref
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+_current_run = contextvars.ContextVar("current_run", default=None)
+
+
+def _new_histogram():
+    return {"count": 0, "sum": 0.0, "buckets": [0] * len(DURATION_BUCKETS)}
+
+
+def _observe(histogram, seconds):
+    histogram["count"] += 1
+    histogram["sum"] += seconds
+    for position, bound in enumerate(DURATION_BUCKETS):
+        if seconds <= bound:
+            histogram["buckets"][position] += 1
+
+
+def _merge_histogram(total, histogram):
+    total["count"] += histogram["count"]
+    total["sum"] += histogram["sum"]
+    total["buckets"] = [a + b for a, b in zip(total["buckets"], histogram["buckets"])]
+
+
+def _merge_snapshot(totals, snapshot):
+    for section in ("stages", "runs"):
+        for name, histogram in snapshot[section].items():
+            total = totals[section].setdefault(name, {"errors": 0, **_new_histogram()})
+            _merge_histogram(total, histogram)
+            total["errors"] += histogram.get("errors", 0)
+    for name, value in snapshot["counters"].items():
+        totals["counters"][name] = totals["counters"].get(name, 0) + value
+
+
+def _process_alive(pid):
+    if pid <= 0:
+        return False  # a snapshot from before pids were recorded
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _read_json(path):
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json(path, data):
+    with open(f"{path}.tmp", "w") as file:
+        json.dump(data, file)
+    os.replace(f"{path}.tmp", path)
+
+
+class PipelineMetrics:
+    """Per-stage timers, run timers and counters for the reconciliation pipeline.
+
+    Each process accumulates in memory and writes a snapshot to
+    ``<directory>/metrics-<uuid>.json`` whenever a run finishes; the uuid is
+    drawn per process, so a recycled worker that gets a dead one's pid never
+    overwrites its totals. ``render`` sums the snapshots of every process, so
+    the Prometheus output covers all server workers and job processes. The
+    snapshots of processes that have exited are folded into
+    ``metrics-retired.json`` and removed, which keeps the counters monotonic
+    across worker restarts without the directory growing.
+
+    Timings and counters recorded inside ``run`` are also collected for that run
+    and appended as one JSON line to ``<directory>/runs.jsonl``, which is rotated
+    to ``runs.jsonl.1`` ... ``runs.jsonl.<run_log_backups>`` once it reaches
+    ``run_log_max_bytes``.
+    """
+
+    def __init__(self, directory, run_log_max_bytes=50 * 1024 * 1024, run_log_backups=3):
+        self.directory = directory
+        self.run_log_path = os.path.join(directory, "runs.jsonl")
+        self.retired_path = os.path.join(directory, "metrics-retired.json")
+        self.run_log_max_bytes = run_log_max_bytes
+        self.run_log_backups = run_log_backups
+        self._lock = threading.Lock()
+        self._reset()
+        # A forked child starts from zero; its parent keeps reporting what it recorded itself
+        reset = weakref.WeakMethod(self._reset)
+        os.register_at_fork(after_in_child=lambda: (method := reset()) is not None and method())
+
+    def _reset(self):
+        self._process_id = uuid.uuid4().hex
+        self._stages = {}
+        self._runs = {}
+        self._counters = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def observe(self, name, seconds):
+        with self._lock:
+            _observe(self._stages.setdefault(name, _new_histogram()), seconds)
+        run = _current_run.get()
+        if run is not None:
+            run["stages"][name] = run["stages"].get(name, 0.0) + seconds
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+        run = _current_run.get()
+        if run is not None:
+            run["counters"][name] = run["counters"].get(name, 0) + value
+
+    @contextmanager
+    def run(self, kind, **fields):
+        """Time one pipeline run; yields its log record so callers can add fields to it."""
+        record = {"run_id": uuid.uuid4().hex, "kind": kind, "started_at": time.time(), **fields,
+                  "status": "ok", "stages": {}, "counters": {}}
+        token = _current_run.set(record)
+        start = time.perf_counter()
+        try:
+            yield record
+        except Exception as e:
+            record["status"] = "error"
+            record["error"] = str(e)
+            raise
+        finally:
+            _current_run.reset(token)
+            record["seconds"] = time.perf_counter() - start
+            with self._lock:
+                runs = self._runs.setdefault(kind, {"errors": 0, **_new_histogram()})
+                _observe(runs, record["seconds"])
+                runs["errors"] += record["status"] == "error"
+            try:
+                self.write_run_log(record)
+                self.flush()
+            except OSError as e:
+                print(f"Failed to write pipeline metrics: {e}")
+
+    def write_run_log(self, record):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.run_log_path, "a") as run_log:
+            run_log.write(json.dumps(record, default=str) + "\n")
+            size = run_log.tell()
+        if size >= self.run_log_max_bytes:
+            with self._locked():
+                # Another process may have rotated it while this one waited for the lock
+                if os.path.exists(self.run_log_path) and os.path.getsize(self.run_log_path) >= self.run_log_max_bytes:
+                    for generation in range(self.run_log_backups - 1, 0, -1):
+                        if os.path.exists(f"{self.run_log_path}.{generation}"):
+                            os.replace(f"{self.run_log_path}.{generation}", f"{self.run_log_path}.{generation + 1}")
+                    os.replace(self.run_log_path, f"{self.run_log_path}.1")
+
+    def snapshot(self):
+        with self._lock:
+            return json.loads(json.dumps({"stages": self._stages, "runs": self._runs, "counters": self._counters}))
+
+    def flush(self):
+        os.makedirs(self.directory, exist_ok=True)
+        snapshot = {"pid": os.getpid(), **self.snapshot()}
+        _write_json(os.path.join(self.directory, f"metrics-{self._process_id}.json"), snapshot)
+
+    def retire_dead_processes(self):
+        """Fold the snapshots of processes that have exited into the retired totals."""
+        with self._locked():
+            retired = _read_json(self.retired_path) or {"stages": {}, "runs": {}, "counters": {}}
+            dead = []
+            for path in self._snapshot_paths():
+                snapshot = _read_json(path)
+                if snapshot is not None and not _process_alive(snapshot.get("pid", 0)):
+                    _merge_snapshot(retired, snapshot)
+                    dead.append(path)
+            if dead:
+                # The retired totals are written before the snapshots go, so a crash in between only double-counts
+                _write_json(self.retired_path, retired)
+                for path in dead:
+                    os.remove(path)
+
+    def collect(self):
+        """Sum the snapshots of every process, this one included, and those of retired processes."""
+        self.flush()
+        self.retire_dead_processes()
+        totals = {"stages": {}, "runs": {}, "counters": {}}
+        for path in self._snapshot_paths() + [self.retired_path]:
+            snapshot = _read_json(path)
+            if snapshot is not None:
+                _merge_snapshot(totals, snapshot)
+        return totals
+
+    def _snapshot_paths(self):
+        return [path for path in glob.glob(os.path.join(self.directory, "metrics-*.json")) if path != self.retired_path]
+
+    @contextmanager
+    def _locked(self):
+        # Folding snapshots and rotating the run log are done by one process at a time
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, "metrics.lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def render(self):
+        """Return the aggregated metrics in the Prometheus text exposition format."""
+        totals = self.collect()
+        lines = []
+
+        def histogram_lines(metric, label, entries):
+            for name, histogram in sorted(entries.items()):
+                for bound, count in zip(DURATION_BUCKETS, histogram["buckets"]):
+                    lines.append(f'{metric}_bucket{{{label}="{name}",le="{bound}"}} {count}')
+                lines.append(f'{metric}_bucket{{{label}="{name}",le="+Inf"}} {histogram["count"]}')
+                lines.append(f'{metric}_sum{{{label}="{name}"}} {histogram["sum"]:.6f}')
+                lines.append(f'{metric}_count{{{label}="{name}"}} {histogram["count"]}')
+
+        lines += ["# HELP recon_stage_seconds Time spent in each pipeline stage.",
+                  "# TYPE recon_stage_seconds histogram"]
+        histogram_lines("recon_stage_seconds", "stage", totals["stages"])
+        lines += ["# HELP recon_run_seconds Duration of whole reconciliation, training and job runs.",
+                  "# TYPE recon_run_seconds histogram"]
+        histogram_lines("recon_run_seconds", "kind", totals["runs"])
+        lines += ["# HELP recon_run_errors_total Runs that ended with an error.",
+                  "# TYPE recon_run_errors_total counter"]
+        lines += [f'recon_run_errors_total{{kind="{kind}"}} {runs["errors"]}' for kind, runs in sorted(totals["runs"].items())]
+        for name, value in sorted(totals["counters"].items()):
+            lines += [f"# TYPE recon_{name}_total counter", f"recon_{name}_total {value}"]
+        return "\n".join(lines) + "\n"
+
+
+class RequestProfiler:
+    """Opt-in cProfile and tracemalloc capture of a single request.
+
+    Only one request per process is profiled at a time; ``start`` returns False
+    when another capture is already running.
+    """
+
+    _active = threading.Lock()
+
+    def __init__(self, directory, top=30):
+        self.directory = directory
+        self.top = top
+        self.profile_id = uuid.uuid4().hex
+        self._profiler = None
+        self._started_tracemalloc = False
+
+    def start(self):
+        if not self._active.acquire(blocking=False):
+            return False
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(25)
+            self._started_tracemalloc = True
+        tracemalloc.reset_peak()
+        self._profiler = cProfile.Profile()
+        self._profiler.enable()
+        return True
+
+    def stop(self, label):
+        """Write ``<id>.prof`` (for pstats/snakeviz) and a ``<id>.txt`` summary; returns the profile id."""
+        try:
+            self._profiler.disable()
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+
+            os.makedirs(self.directory, exist_ok=True)
+            base = os.path.join(self.directory, self.profile_id)
+            self._profiler.dump_stats(f"{base}.prof")
+
+            summary = io.StringIO()
+            summary.write(f"{label}\ntraced memory: current {current / 2**20:.1f} MB, peak {peak / 2**20:.1f} MB\n\n")
+            pstats.Stats(self._profiler, stream=summary).sort_stats("cumulative").print_stats(self.top)
+            summary.write("\nTop allocations by line:\n")
+            for stat in snapshot.statistics("lineno")[:self.top]:
+                summary.write(f"{stat}\n")
+            with open(f"{base}.txt", "w") as file:
+                file.write(summary.getvalue())
+            return self.profile_id
+        finally:
+            self._active.release()
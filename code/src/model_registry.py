@@ -0,0 +1,75 @@
+import os
+import threading
+
+import joblib
+
+
+class ModelRegistry:
+    """In-process cache of loaded model artifacts.
+
+    Entries are keyed by artifact path and remember the file version (mtime and
+    size) they were loaded from, so a model is only unpickled again after the
+    file on disk changes.
+    """
+
+    def __init__(self, loader=joblib.load, dumper=joblib.dump):
+        self._loader = loader
+        self._dumper = dumper
+        self._lock = threading.Lock()
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def file_version(path):
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def get(self, path):
+        """Return the model stored at ``path``, or None if there is no artifact."""
+        with self._lock:
+            try:
+                version = self.file_version(path)
+            except FileNotFoundError:
+                self._entries.pop(path, None)
+                return None
+
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == version:
+                self.hits += 1
+                return entry[1]
+
+            model = self._loader(path)
+            self._entries[path] = (version, model)
+            self.misses += 1
+            return model
+
+    def publish(self, path, model):
+        """Write a new artifact and swap it in for readers of ``path`` atomically."""
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        temp_path = os.path.join(directory, f".{os.path.basename(path)}.{os.getpid()}.{threading.get_ident()}.tmp")
+        self._dumper(model, temp_path)
+        with self._lock:
+            os.replace(temp_path, path)
+            self._entries[path] = (self.file_version(path), model)
+
+    def invalidate(self, path=None):
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(path, None)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "models": {
+                    path: {"mtime_ns": version[0], "size": version[1]}
+                    for path, (version, _) in self._entries.items()
+                },
+            }
@@ -0,0 +1,119 @@
+import io
+import queue
+import threading
+
+MATCHED_RECORDS_TABLE = "matched_records"
+MATCHED_RECORDS_COLUMNS = [
+    "As of Date", "Company", "Account", "AU", "Currency", "Primary Account", "Secondary Account",
+    "GL Balance", "iHub Balance", "Balance Difference", "Match Status", "Comments", "Anomaly",
+]
+
+
+def write_matched_records(engine, dataframe, table=MATCHED_RECORDS_TABLE, batch_size=50_000):
+    """Bulk-load the matched_records columns of ``dataframe``; returns the number of rows written.
+
+    Postgres is loaded with COPY FROM STDIN in batches of ``batch_size`` rows inside
+    a single transaction. Other databases (SQLite in tests and benchmarks) fall
+    back to batched executemany inserts.
+    """
+    columns = [col for col in MATCHED_RECORDS_COLUMNS if col in dataframe.columns]
+    if dataframe.empty or not columns:
+        return 0
+
+    frame = dataframe[columns]
+    if engine.dialect.name == "postgresql":
+        _copy_batches(engine, frame, table, columns, batch_size)
+    else:
+        frame.to_sql(table, engine, if_exists="append", index=False, chunksize=batch_size)
+    return len(frame)
+
+
+def _copy_batches(engine, frame, table, columns, batch_size):
+    column_list = ", ".join(f'"{col}"' for col in columns)
+    copy_sql = f"COPY {table} ({column_list}) FROM STDIN WITH (FORMAT csv)"
+
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        for start in range(0, len(frame), batch_size):
+            buffer = io.StringIO()
+            # Missing values become unquoted empty fields, which COPY reads as NULL
+            frame.iloc[start:start + batch_size].to_csv(buffer, header=False, index=False)
+            if hasattr(cursor, "copy_expert"):
+                buffer.seek(0)
+                cursor.copy_expert(copy_sql, buffer)
+            else:
+                with cursor.copy(copy_sql) as copy:
+                    copy.write(buffer.getvalue())
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+
+
+class MatchedRecordWriter:
+    """Persists matched records either inline or from a background writer thread.
+
+    In background mode ``submit`` only enqueues the frame; the bounded queue makes
+    callers wait once ``max_pending`` frames are outstanding so a slow database
+    applies backpressure instead of growing memory without limit.
+    """
+
+    def __init__(self, engine, batch_size=50_000, background=True, max_pending=8):
+        self.engine = engine
+        self.batch_size = batch_size
+        self.background = background
+        self.rows_written = 0
+        self.errors = 0
+        self.last_error = None
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, dataframe):
+        if dataframe.empty:
+            return
+        if not self.background:
+            self._write(dataframe)
+            return
+        self._ensure_thread()
+        self._queue.put(dataframe)
+
+    def flush(self):
+        """Block until every submitted frame has been written (or has failed)."""
+        if self._thread is not None:
+            self._queue.join()
+
+    def stats(self):
+        return {
+            "rows_written": self.rows_written,
+            "errors": self.errors,
+            "last_error": self.last_error,
+            "pending": self._queue.qsize(),
+        }
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="matched-record-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            dataframe = self._queue.get()
+            try:
+                self._write(dataframe)
+            finally:
+                self._queue.task_done()
+
+    def _write(self, dataframe):
+        try:
+            self.rows_written += write_matched_records(self.engine, dataframe, batch_size=self.batch_size)
+        except Exception as e:
+            self.errors += 1
+            self.last_error = str(e)
+            print(f"Failed to persist matched records: {e}")
+            if not self.background:
+                raise
@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+
+# Scales a median absolute deviation to the standard deviation of a normal distribution
+MAD_TO_STD = 1.4826
+
+
+def resolve_fast_path(dataframe, difference_columns, baseline_store, z_threshold=3.0, mad_threshold=3.5,
+                      min_history=30):
+    """Find the rows that can be settled without the anomaly model.
+
+    Returns two boolean arrays over the rows of ``dataframe``:
+
+    * ``exact`` - every difference is exactly zero;
+    * ``within_band`` - not exact, but every difference is within ``z_threshold``
+      standard deviations of its key's historical mean, or within
+      ``mad_threshold`` scaled MADs of the median of its recent values. Keys with
+      fewer than ``min_history`` observations are never resolved this way.
+
+    Everything else is ambiguous and still needs the model. ``dataframe`` only
+    needs the store's key columns and the difference columns.
+    """
+    row_count = len(dataframe)
+    if not difference_columns:
+        return np.zeros(row_count, dtype=bool), np.zeros(row_count, dtype=bool)
+
+    differences = np.column_stack([
+        pd.to_numeric(dataframe[col], errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+        for col in difference_columns
+    ])
+    exact = (differences == 0).all(axis=1)
+
+    within_band = ~exact
+    for position, col in enumerate(difference_columns):
+        if not within_band.any():
+            break
+        values = differences[:, position]
+        baselines = baseline_store.lookup(dataframe, col)
+        count = baselines["count"].fillna(0).to_numpy(dtype=np.float64)
+        deviation = np.abs(values - baselines["mean"].to_numpy(dtype=np.float64))
+        robust_deviation = np.abs(values - baselines["median"].to_numpy(dtype=np.float64))
+        with np.errstate(invalid="ignore"):
+            in_z_band = deviation <= z_threshold * baselines["std"].to_numpy(dtype=np.float64)
+            in_mad_band = robust_deviation <= mad_threshold * MAD_TO_STD * baselines["mad"].to_numpy(dtype=np.float64)
+        # NaN differences or baselines compare False, so those rows stay ambiguous
+        within_band &= (count >= min_history) & (in_z_band | in_mad_band)
+
+    return exact, within_band
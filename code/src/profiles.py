@@ -0,0 +1,231 @@
+import json
+import os
+import re
+import threading
+from dataclasses import dataclass, field
+
+PROFILE_NAME_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+@dataclass(frozen=True)
+class FrameLayout:
+    """What a ColumnPlan computes for one particular set of input columns."""
+
+    numeric_columns: tuple
+    differences: tuple  # (difference column, left column, right column)
+    anomaly_columns: tuple
+    match_labels: tuple
+
+
+@dataclass(frozen=True)
+class ColumnPlan:
+    """The column layout a reconciliation config describes, parsed and validated once."""
+
+    key_columns: tuple
+    criteria_columns: tuple
+    derived_column: str
+    comment_column: str
+    comment_prompt: str
+    compare_current_criteria_column: bool
+    db_columns: tuple
+    group_columns: tuple = ()
+    prefilter: bool = True
+    prefilter_z_threshold: float = 3.0
+    prefilter_mad_threshold: float = 3.5
+    prefilter_min_history: int = 30
+    join_partitions: int = 0
+    _layouts: dict = field(default_factory=dict, compare=False, repr=False)
+
+    @classmethod
+    def from_config(cls, config):
+        criteria_columns = tuple(config.get("criteria_columns", []))
+        compare_current_criteria_column = parse_flag(config.get("compare_current_criteria_column", True))
+        db_columns = tuple(config.get("db_columns", "").split(","))
+
+        if criteria_columns and compare_current_criteria_column and len(criteria_columns) < 2:
+            raise ValueError("Please provide at least two 'criteria_columns' to compare.")
+        if criteria_columns and not compare_current_criteria_column and len(db_columns) < 2:
+            raise ValueError("Please provide at least two database column names in 'db_columns' (comma-separated).")
+
+        # Per-group anomaly models: explicit "group_model_columns", or the key columns when "group_models" is set
+        group_columns = tuple(config.get("group_model_columns") or
+                              (config.get("key_columns", []) if parse_flag(config.get("group_models", False)) else []))
+
+        return cls(
+            key_columns=tuple(config.get("key_columns", [])),
+            criteria_columns=criteria_columns,
+            derived_column=config.get("derived_column", "Balance Difference"),
+            comment_column=config.get("comment_column", "Comments"),
+            comment_prompt=config.get("comment_prompt", ""),
+            compare_current_criteria_column=compare_current_criteria_column,
+            db_columns=db_columns[:2],
+            group_columns=group_columns,
+            prefilter=parse_flag(config.get("prefilter", True)),
+            prefilter_z_threshold=float(config.get("prefilter_z_threshold", 3.0)),
+            prefilter_mad_threshold=float(config.get("prefilter_mad_threshold", 3.5)),
+            prefilter_min_history=int(config.get("prefilter_min_history", 30)),
+            join_partitions=int(config.get("join_partitions", 0)),
+        )
+
+    def layout(self, columns):
+        """Resolve the plan against a frame's (stripped) columns; cached, as every chunk of a file repeats them."""
+        columns = tuple(columns)
+        layout = self._layouts.get(columns)
+        if layout is not None:
+            return layout
+
+        available = set(columns)
+        # A criteria column also counts when only its prefixed pair is there, as in a joined two-source frame
+        criteria_columns = [col for col in self.criteria_columns if col in available or (
+            not self.compare_current_criteria_column
+            and all(f"{db_column} {col}".strip() in available for db_column in self.db_columns)
+        )]
+        if not criteria_columns:
+            raise ValueError("No valid criteria columns found in DataFrame.")
+
+        if self.compare_current_criteria_column:
+            if len(criteria_columns) < 2:
+                raise ValueError("Please provide at least two 'criteria_columns' to compare.")
+            differences = ((self.derived_column, criteria_columns[0], criteria_columns[1]),)
+            numeric_columns = tuple(criteria_columns)
+            anomaly_columns = tuple(criteria_columns)
+        else:
+            db_column_1, db_column_2 = self.db_columns
+            differences = tuple(
+                (f"Difference {col}", f"{db_column_1} {col}".strip(), f"{db_column_2} {col}".strip())
+                for col in criteria_columns
+                if f"{db_column_1} {col}".strip() in available and f"{db_column_2} {col}".strip() in available
+            )
+            numeric_columns = tuple(dict.fromkeys(col for _, left, right in differences for col in (left, right)))
+            anomaly_columns = tuple(name for name, _, _ in differences)
+
+        layout = FrameLayout(
+            numeric_columns=numeric_columns,
+            differences=differences,
+            anomaly_columns=anomaly_columns,
+            match_labels=tuple(f"{name.replace('Difference ', '')} Break" for name, _, _ in differences),
+        )
+        self._layouts[columns] = layout
+        return layout
+
+    @property
+    def source_names(self):
+        """Names of the two sides of a two-source reconciliation: the db_columns prefixes when both are set."""
+        names = tuple(name.strip() for name in self.db_columns)
+        if len(names) == 2 and all(names):
+            return names
+        return ("Left", "Right")
+
+    @property
+    def input_columns(self):
+        """Columns to read from an input file, or None to read all of them."""
+        if not self.criteria_columns:
+            return None
+        columns = list(self.key_columns) + [col for col in self.group_columns if col not in self.key_columns]
+        columns += list(self.criteria_columns)
+        if not self.compare_current_criteria_column:
+            columns += [f"{db_column} {col}".strip() for db_column in self.db_columns for col in self.criteria_columns]
+        return columns
+
+
+@dataclass(frozen=True)
+class ReconciliationProfile:
+    """A named reconciliation config together with its compiled plan and model artifact."""
+
+    name: str
+    config: dict = field(compare=False)
+    plan: ColumnPlan
+    model_path: str
+    baseline_file: str = None  # overrides the baselines kept next to the model, as batch runs do
+
+    @property
+    def baseline_path(self):
+        return self.baseline_file or os.path.join(os.path.dirname(self.model_path), "baselines.parquet")
+
+    @property
+    def actions_path(self):
+        return os.path.join(os.path.dirname(self.model_path), "actions.json")
+
+    @classmethod
+    def from_config(cls, name, config, model_path, baseline_file=None):
+        return cls(name=name, config=config, plan=ColumnPlan.from_config(config), model_path=model_path,
+                   baseline_file=baseline_file)
+
+
+def parse_flag(value):
+    """A config switch as a bool; JSON booleans, 0/1 and strings such as "false" or "yes" are accepted."""
+    if isinstance(value, str):
+        lowered = value.strip().lower()
+        if lowered in ("true", "1", "yes", "on"):
+            return True
+        if lowered in ("false", "0", "no", "off", ""):
+            return False
+        raise ValueError(f"'{value}' is not a valid true/false setting.")
+    return bool(value)
+
+
+def write_config(path, config):
+    """Write a config as JSON, replacing any previous file atomically."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w") as file:
+        json.dump(config, file)
+    os.replace(temp_path, path)
+
+
+def config_version(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class ProfileRegistry:
+    """Thread-safe store of named profiles, backed by ``<models_dir>/<name>/config.json``.
+
+    Registered configs are written to disk so that every server worker process
+    (and a restarted server) sees the same profiles; a profile is re-read when
+    its config file changes.
+    """
+
+    def __init__(self, models_dir):
+        self.models_dir = models_dir
+        self._lock = threading.Lock()
+        self._profiles = {}
+
+    def config_path(self, name):
+        return os.path.join(self.models_dir, name, "config.json")
+
+    def _build(self, name, config):
+        return ReconciliationProfile.from_config(name, config, os.path.join(self.models_dir, name, "anomaly_model.pkl"))
+
+    def register(self, name, config):
+        if not PROFILE_NAME_PATTERN.match(name or ""):
+            raise ValueError("Profile ids may only contain letters, digits, '-' and '_'.")
+        profile = self._build(name, config)
+        with self._lock:
+            write_config(self.config_path(name), config)
+            self._profiles[name] = (config_version(self.config_path(name)), profile)
+        return profile
+
+    def get(self, name):
+        if not PROFILE_NAME_PATTERN.match(name or ""):
+            raise ValueError(f"Unknown config profile '{name}'.")
+        with self._lock:
+            version = config_version(self.config_path(name))
+            if version is None:
+                self._profiles.pop(name, None)
+                raise ValueError(f"Unknown config profile '{name}'.")
+            entry = self._profiles.get(name)
+            if entry is None or entry[0] != version:
+                with open(self.config_path(name)) as file:
+                    entry = (version, self._build(name, json.load(file)))
+                self._profiles[name] = entry
+            return entry[1]
+
+    def names(self):
+        if not os.path.isdir(self.models_dir):
+            return []
+        return sorted(name for name in os.listdir(self.models_dir)
+                      if PROFILE_NAME_PATTERN.match(name) and os.path.exists(self.config_path(name)))
@@ -0,0 +1,297 @@
+import collections
+import glob
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+
+RESULT_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+CACHE_KEY_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+HASH_BLOCK_SIZE = 1024 * 1024
+# Filtered or sorted result tables kept per process, so paging through them does not redo the work
+QUERY_CACHE_SIZE = 4
+EXPORT_FORMATS = {
+    "arrow": ("application/vnd.apache.arrow.file", "arrow"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+
+def write_result_part(directory, index, dataframe):
+    """Write one Parquet part of a result set; returns its {"file", "rows"} entry."""
+    part_file = f"part-{index:05d}.parquet"
+    dataframe.to_parquet(os.path.join(directory, part_file), index=False)
+    return {"file": part_file, "rows": len(dataframe)}
+
+
+def content_key(streams, *parts):
+    """SHA-256 over the bytes of ``streams`` and the JSON of ``parts``; every stream is rewound afterwards."""
+    digest = hashlib.sha256()
+    for stream in streams:
+        stream.seek(0)
+        while block := stream.read(HASH_BLOCK_SIZE):
+            digest.update(block)
+        stream.seek(0)
+        digest.update(b"\0")
+    digest.update(json.dumps(parts, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+
+def result_part_paths(directory):
+    return sorted(glob.glob(os.path.join(directory, "part-*.parquet")))
+
+
+def parse_filters(values):
+    """Turn ``Column:value`` strings into {column: [values]}; repeated columns match any of their values."""
+    filters = {}
+    for value in values:
+        column, separator, wanted = value.partition(":")
+        if not separator or not column:
+            raise ValueError(f"Filters look like 'Column:value', got '{value}'.")
+        filters.setdefault(column, []).append(wanted)
+    return filters
+
+
+def load_result_table(paths):
+    if not paths:
+        return pa.table({})
+    # Parts are written chunk by chunk, so a column that is all-null in one part may be typed in another
+    tables = [pq.read_table(path, memory_map=True) for path in paths]
+    # Categorical columns become per-part dictionaries; IPC files need one dictionary per column
+    return pa.concat_tables(tables, promote_options="permissive").unify_dictionaries()
+
+
+def _filter_table(table, filters):
+    mask = None
+    for column, wanted in filters.items():
+        if column not in table.column_names:
+            raise ValueError(f"Unknown column '{column}'.")
+        values = table[column]
+        if pa.types.is_dictionary(values.type):
+            values = pc.cast(values, values.type.value_type)
+        try:
+            wanted = pc.cast(pa.array(wanted), values.type) if not pa.types.is_null(values.type) else pa.array(wanted)
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+            raise ValueError(f"'{wanted[0]}' is not a valid value for column '{column}'.")
+        matches = pc.is_in(values, value_set=wanted)
+        mask = matches if mask is None else pc.and_(mask, matches)
+    return table if mask is None else table.filter(mask)
+
+
+_query_cache = collections.OrderedDict()
+_query_cache_lock = threading.Lock()
+
+
+def _read_row_range(paths, start, stop):
+    """Rows ``start:stop`` of the parts in order, reading only the parts that overlap them; also returns the total."""
+    tables = []
+    offset = 0
+    for path in paths:
+        rows = pq.read_metadata(path).num_rows
+        part_start, offset = offset, offset + rows
+        if offset <= start or part_start >= stop:
+            continue
+        table = pq.read_table(path, memory_map=True)
+        first = max(start - part_start, 0)
+        tables.append(table.slice(first, min(stop, offset) - part_start - first))
+    if not tables:
+        tables = [pq.read_schema(paths[0]).empty_table()]
+    return pa.concat_tables(tables, promote_options="permissive").unify_dictionaries(), offset
+
+
+def _query_table(paths, filters, sort_by, descending):
+    """The filtered, sorted table of a result set; cached per parts, filters and sort order."""
+    key = (tuple((path, os.stat(path).st_mtime_ns) for path in paths),
+           tuple(sorted((column, tuple(values)) for column, values in filters.items())), sort_by, descending)
+    with _query_cache_lock:
+        table = _query_cache.get(key)
+        if table is not None:
+            _query_cache.move_to_end(key)
+            return table
+
+    table = _filter_table(load_result_table(paths), filters)
+    if sort_by:
+        if sort_by not in table.column_names:
+            raise ValueError(f"Unknown column '{sort_by}'.")
+        table = table.sort_by([(sort_by, "descending" if descending else "ascending")])
+    with _query_cache_lock:
+        _query_cache[key] = table
+        while len(_query_cache) > QUERY_CACHE_SIZE:
+            _query_cache.popitem(last=False)
+    return table
+
+
+def query_results(paths, filters=None, sort_by=None, descending=False, page=1, page_size=100):
+    """Return one page (1-based) of the filtered, sorted result rows and the number of matching rows.
+
+    Without filters or a sort order only the parts holding the page are read.
+    """
+    if not paths:
+        return pd.DataFrame(), 0
+    start = (page - 1) * page_size
+    if not filters and not sort_by:
+        table, total = _read_row_range(paths, start, start + page_size)
+        return table.to_pandas(), total
+    table = _query_table(paths, filters or {}, sort_by, descending)
+    return table.slice(start, page_size).to_pandas(), table.num_rows
+
+
+def export_results(paths, file_format, filters=None):
+    """Serialize the filtered result rows as an Arrow IPC file or Parquet; returns (bytes, mimetype, extension)."""
+    if file_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported download format '{file_format}'; use one of {sorted(EXPORT_FORMATS)}.")
+    table = _filter_table(load_result_table(paths), filters or {})
+    sink = io.BytesIO()
+    if file_format == "arrow":
+        with ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    else:
+        pq.write_table(table, sink)
+    mimetype, extension = EXPORT_FORMATS[file_format]
+    return sink.getvalue(), mimetype, extension
+
+
+def _directory_size(path):
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+
+def evict_directories(paths, max_age_seconds, max_bytes=None):
+    """Remove the directories unused for ``max_age_seconds``, then the least recently used ones
+    until the rest fit in ``max_bytes``. A directory's mtime counts as its last use."""
+    cutoff = time.time() - max_age_seconds
+    kept = []
+    for path in paths:
+        try:
+            mtime = os.stat(path).st_mtime
+            if mtime < cutoff:
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                kept.append((mtime, _directory_size(path), path))
+        except FileNotFoundError:
+            continue  # removed by another worker in the meantime
+
+    if max_bytes is None:
+        return
+    total = sum(size for _, size, _ in kept)
+    for _, size, path in sorted(kept):
+        if total <= max_bytes:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+
+
+class CacheIndex:
+    """Maps content keys (see ``content_key``) to ids, one small file per key, shared by all processes."""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def get(self, cache_key):
+        if not CACHE_KEY_PATTERN.match(cache_key or ""):
+            return None
+        path = os.path.join(self.directory, cache_key)
+        try:
+            with open(path) as file:
+                value = file.read()
+            os.utime(path)  # purge goes by mtime, so an entry in use is kept as long as what it points to
+        except OSError:
+            return None
+        return value
+
+    def put(self, cache_key, value):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, cache_key)
+        with open(f"{path}.{value}.tmp", "w") as file:
+            file.write(value)
+        os.replace(f"{path}.{value}.tmp", path)
+
+    def discard(self, cache_key):
+        try:
+            os.remove(os.path.join(self.directory, cache_key))
+        except OSError:
+            pass
+
+    def purge(self, max_age_seconds):
+        if not os.path.isdir(self.directory):
+            return
+        cutoff = time.time() - max_age_seconds
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                continue
+
+
+class ResultStore:
+    """Server-side result sets of reconciliation runs, one directory of Parquet parts each.
+
+    A result set saved with a ``cache_key`` can be found again with ``lookup``,
+    together with the summary it was saved with. Whenever a new set is saved,
+    sets unused for ``max_age_seconds`` are removed, then the least recently
+    used ones until the store fits in ``max_bytes``.
+    """
+
+    def __init__(self, directory, max_age_seconds=24 * 3600, max_bytes=None):
+        self.directory = directory
+        self.max_age_seconds = max_age_seconds
+        self.max_bytes = max_bytes
+        self.index = CacheIndex(os.path.join(directory, "index"))
+
+    def path(self, result_id):
+        """Return the result set's directory, or None if the id is unknown."""
+        if not RESULT_ID_PATTERN.match(result_id or ""):
+            return None
+        path = os.path.join(self.directory, result_id)
+        return path if os.path.isdir(path) else None
+
+    def save(self, dataframe, cache_key=None, summary=None):
+        self.purge()
+        result_id = uuid.uuid4().hex
+        temp_path = os.path.join(self.directory, f".{result_id}.tmp")
+        os.makedirs(temp_path)
+        if not dataframe.empty:
+            write_result_part(temp_path, 0, dataframe)
+        with open(os.path.join(temp_path, "summary.json"), "w") as file:
+            json.dump(summary or {}, file, default=str)
+        os.replace(temp_path, os.path.join(self.directory, result_id))
+        if cache_key is not None:
+            self.index.put(cache_key, result_id)
+        return result_id
+
+    def lookup(self, cache_key):
+        """Return (result_id, summary) of the set saved under ``cache_key``, or None."""
+        result_id = self.index.get(cache_key)
+        path = self.path(result_id)
+        if path is None:
+            if result_id is not None:
+                self.index.discard(cache_key)  # the set itself has been evicted
+            return None
+        try:
+            with open(os.path.join(path, "summary.json")) as file:
+                summary = json.load(file)
+            os.utime(path)  # mark it used, for eviction
+        except (OSError, ValueError):
+            return None
+        return result_id, summary
+
+    def purge(self):
+        if not os.path.isdir(self.directory):
+            return
+        # Half-written sets (".<id>.tmp") are only ever removed once they are old
+        evict_directories([entry.path for entry in os.scandir(self.directory)
+                           if entry.is_dir() and entry.name.startswith(".")], self.max_age_seconds)
+        evict_directories([entry.path for entry in os.scandir(self.directory)
+                           if entry.is_dir() and RESULT_ID_PATTERN.match(entry.name)],
+                          self.max_age_seconds, self.max_bytes)
+        self.index.purge(self.max_age_seconds)
@@ -0,0 +1,139 @@
+import os
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import IsolationForest
+from sklearn.preprocessing import StandardScaler
+from sqlalchemy import text
+
+from group_models import GroupedAnomalyModel
+
+
+class IncrementalTrainer:
+    """Warm-start anomaly training over a growing matched_records history.
+
+    Only rows past the stored high-water mark are read, in streamed chunks. The
+    scaler statistics are updated with ``partial_fit`` over every row ever seen,
+    while the IsolationForest is refit on a bounded sample of the history: a
+    uniform reservoir sample by default, or the most recent rows with
+    ``sampling="window"``. Training cost therefore depends on the number of new
+    rows, not on the size of the table.
+
+    With ``group_columns`` the sample keeps each row's group key as well, and a
+    GroupedAnomalyModel is fitted from it instead of a single global forest.
+
+    The state (high-water mark, scaler, sample) is kept next to the model
+    artifact in ``<model_path>.history.joblib``.
+    """
+
+    def __init__(self, model_path, sample_size=100_000, sampling="reservoir", chunk_size=50_000,
+                 table="matched_records", watermark_column="id", seed=42):
+        if sampling not in ("reservoir", "window"):
+            raise ValueError("sampling must be 'reservoir' or 'window'.")
+        self.model_path = model_path
+        self.state_path = f"{model_path}.history.joblib"
+        self.sample_size = sample_size
+        self.sampling = sampling
+        self.chunk_size = chunk_size
+        self.table = table
+        self.watermark_column = watermark_column
+        self.rng = np.random.default_rng(seed)
+
+    def load_state(self, feature_key):
+        if os.path.exists(self.state_path):
+            state = joblib.load(self.state_path)
+            if state["feature_key"] == feature_key:
+                return state
+        return {"feature_key": feature_key, "high_water_mark": None, "rows_seen": 0,
+                "scaler": StandardScaler(), "sample": None, "sample_keys": None}
+
+    def save_state(self, state):
+        temp_path = f"{self.state_path}.tmp"
+        joblib.dump(state, temp_path)
+        os.replace(temp_path, self.state_path)
+
+    def iter_new_rows(self, connection, columns, high_water_mark):
+        column_list = ", ".join(f'"{col}"' for col in [self.watermark_column] + list(columns))
+        where = f'WHERE "{self.watermark_column}" > :high_water_mark' if high_water_mark is not None else ""
+        query = text(f'SELECT {column_list} FROM {self.table} {where} ORDER BY "{self.watermark_column}"')
+        params = {"high_water_mark": high_water_mark} if high_water_mark is not None else {}
+        yield from pd.read_sql_query(query, connection, params=params, chunksize=self.chunk_size)
+
+    def update_sample(self, state, features, keys=None):
+        """Add ``features`` (and their group ``keys``, row for row) to the sample."""
+        sample, sample_keys = state["sample"], state.get("sample_keys")
+        if self.sampling == "window":
+            sample = features if sample is None else np.concatenate([sample, features])
+            state["sample"] = sample[-self.sample_size:]
+            if keys is not None:
+                sample_keys = keys if sample_keys is None else np.concatenate([sample_keys, keys])
+                state["sample_keys"] = sample_keys[-self.sample_size:]
+            return
+
+        # Algorithm R, vectorized: row t of the stream replaces a random slot with probability k / (t + 1)
+        if sample is None:
+            sample = np.empty((0, features.shape[1]))
+        if keys is not None and sample_keys is None:
+            sample_keys = np.empty((0, keys.shape[1]), dtype=object)
+        free = max(self.sample_size - len(sample), 0)
+        sample = np.concatenate([sample, features[:free]])
+        if keys is not None:
+            sample_keys = np.concatenate([sample_keys, keys[:free]])
+        rest = features[free:]
+        if len(rest):
+            stream_positions = state["rows_seen"] + free + np.arange(len(rest))
+            slots = self.rng.integers(0, stream_positions + 1)
+            keep = slots < self.sample_size
+            sample[slots[keep]] = rest[keep]
+            if keys is not None:
+                sample_keys[slots[keep]] = keys[free:][keep]
+        state["sample"] = sample
+        state["sample_keys"] = sample_keys
+
+    def train(self, engine, select_columns, prepare_features, group_columns=(), min_group_size=50):
+        """Consume new history rows and refit the model.
+
+        ``prepare_features`` turns a chunk of ``select_columns`` into the 2-D feature
+        array the model scores. Returns ``(model, scaler, new_rows)``; the model is
+        None when there was nothing new to learn from. With ``group_columns`` the
+        model is a GroupedAnomalyModel, which carries its own scalers, and the
+        returned scaler is None.
+        """
+        group_columns = list(group_columns)
+        feature_key = (tuple(select_columns), tuple(group_columns)) if group_columns else tuple(select_columns)
+        state = self.load_state(feature_key)
+        new_rows = 0
+        with engine.connect().execution_options(stream_results=True) as connection:
+            for chunk in self.iter_new_rows(connection, select_columns, state["high_water_mark"]):
+                if chunk.empty:
+                    continue
+                high_water_mark = chunk[self.watermark_column].max()
+                keys = chunk[group_columns].to_numpy(dtype=object) if group_columns else None
+                features = np.asarray(prepare_features(chunk.drop(columns=[self.watermark_column])), dtype=np.float64)
+                complete = ~np.isnan(features).any(axis=1)
+                features = features[complete]
+                if len(features):
+                    state["scaler"].partial_fit(features)
+                    self.update_sample(state, features, keys[complete] if keys is not None else None)
+                    state["rows_seen"] += len(features)
+                    new_rows += len(features)
+                state["high_water_mark"] = high_water_mark.item() if hasattr(high_water_mark, "item") else high_water_mark
+
+        if not new_rows:
+            if state["high_water_mark"] is not None:
+                self.save_state(state)
+            return None, None, 0
+
+        if group_columns:
+            feature_columns = [f"feature {position}" for position in range(state["sample"].shape[1])]
+            sample = pd.DataFrame(state["sample"], columns=feature_columns)
+            sample[group_columns] = state["sample_keys"]
+            model = GroupedAnomalyModel.fit(sample, feature_columns, group_columns, min_group_size=min_group_size)
+            self.save_state(state)
+            return model, None, new_rows
+
+        model = IsolationForest(contamination=0.05, random_state=42)
+        model.fit(state["scaler"].transform(state["sample"]))
+        self.save_state(state)
+        return model, state["scaler"], new_rows
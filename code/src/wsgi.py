@@ -0,0 +1,13 @@
+"""WSGI entry point for serving the backend with gunicorn (see gunicorn.conf.py).
+
+Importing this module loads the anomaly models. With ``preload_app`` the import
+happens once in the gunicorn master, before the workers are forked, so every
+worker starts with the models already in (copy-on-write shared) memory.
+"""
+import gc
+
+from backend import app, preload_models
+
+print(f"Preloaded models: {preload_models()}")
+# Keep the preloaded objects out of the cyclic GC so collections in the workers do not dirty their pages
+gc.freeze()
@@ -0,0 +1,625 @@
+"""Performance benchmarks for the reconciliation backend.
+
+Run from this directory with the backend on the path, e.g.
+
+    PYTHONPATH=../src python benchmarks.py match-status --rows 1000000
+
+``suite`` runs the end-to-end pipeline stages on generated data and fails when
+throughput or peak memory regresses past benchmark_baselines.json. Fast stages
+are repeated for a couple of seconds and timed by their best run:
+
+    PYTHONPATH=../src python benchmarks.py suite --rows 200000
+    PYTHONPATH=../src python benchmarks.py suite --rows 200000 --update-baselines
+
+``llm`` compares per-row and batched comment generation against a local stub
+of the Ollama chat API, so no model needs to be running:
+
+    PYTHONPATH=../src python benchmarks.py llm --rows 200 --batch-sizes 1 20
+"""
+import argparse
+import concurrent.futures
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from backend import determine_match_status
+from compact_forest import CompactForest
+from ingest import read_input
+from persistence import MATCHED_RECORDS_TABLE, write_matched_records
+
+KEY_COLUMNS = ["Company", "Account", "AU", "Currency"]
+CRITERIA_COLUMNS = ["GL Balance", "iHub Balance"]
+SUITE_STAGES = ["ingest", "train", "predict", "reconcile", "serialize"]
+# Stages that leave nothing behind are repeated until they have run this long, and their best time is kept;
+# a single run of a fast stage is mostly noise. reconcile updates the baselines, so it only runs once
+REPEATED_STAGES = ("ingest", "predict", "serialize")
+MIN_STAGE_SECONDS = 2.0
+MIN_STAGE_REPEATS = 3
+# Even so a whole process can land on a slow spell of the machine, so baselines are recorded from the median of
+# this many processes, and a stage that looks slower than its baseline is measured again the same way
+STAGE_RUNS = 3
+BASELINES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baselines.json")
+
+
+def legacy_match_status(dataframe, difference_columns):
+    """The original row-wise implementation, kept as the reference for label parity."""
+    def status(row):
+        for col in difference_columns:
+            if row[col] != 0:
+                return f"{col.replace('Difference ', '')} Break"
+        return "Match"
+
+    return dataframe.apply(status, axis=1)
+
+
+def make_difference_frame(rows, difference_columns, break_rate=0.05, nan_rate=0.01, seed=42):
+    rng = np.random.default_rng(seed)
+    data = {}
+    for col in difference_columns:
+        values = np.where(rng.random(rows) < break_rate, rng.normal(0, 1000, rows).round(2), 0.0)
+        values[rng.random(rows) < nan_rate] = np.nan
+        data[col] = values
+    return pd.DataFrame(data)
+
+
+def bench_match_status(rows, legacy_rows):
+    difference_columns = ["Difference Balance", "Difference Quantity", "Difference Price"]
+    dataframe = make_difference_frame(rows, difference_columns)
+
+    start = time.perf_counter()
+    vectorized = determine_match_status(dataframe, difference_columns)
+    vectorized_seconds = time.perf_counter() - start
+
+    sample = dataframe.head(legacy_rows)
+    start = time.perf_counter()
+    legacy = legacy_match_status(sample, difference_columns)
+    legacy_seconds = time.perf_counter() - start
+
+    mismatches = int((np.asarray(vectorized[:legacy_rows], dtype=object) != legacy.to_numpy(dtype=object)).sum())
+    print(f"vectorized: {rows:,} rows in {vectorized_seconds:.3f}s ({rows / vectorized_seconds:,.0f} rows/s)")
+    print(f"legacy:     {len(sample):,} rows in {legacy_seconds:.3f}s ({len(sample) / legacy_seconds:,.0f} rows/s)")
+    print(f"label mismatches on the first {len(sample):,} rows: {mismatches}")
+    return mismatches
+
+
+def make_matched_records_frame(rows, break_rate=0.05, anomaly_rate=0.0, seed=42):
+    """Synthetic GL/iHub balances shaped like the matched_records table in ddl.sql.
+
+    ``break_rate`` of the rows get a small iHub difference; ``anomaly_rate`` of them
+    get a large one instead and are labelled Anomaly = "Yes" as ground truth.
+    """
+    rng = np.random.default_rng(seed)
+    gl_balance = rng.normal(50_000, 20_000, rows).round(2)
+    draw = rng.random(rows)
+    anomalous = draw < anomaly_rate
+    broken = (draw >= anomaly_rate) & (draw < anomaly_rate + break_rate)
+    ihub_balance = np.where(broken, gl_balance + rng.normal(0, 500, rows).round(2), gl_balance)
+    ihub_balance = np.where(anomalous, gl_balance + rng.choice([-1, 1], rows) * rng.uniform(20_000, 200_000, rows).round(2),
+                            ihub_balance)
+    return pd.DataFrame({
+        "As of Date": pd.Timestamp("2025-01-31") - pd.to_timedelta(rng.integers(0, 365, rows), unit="D"),
+        "Company": pd.Series(rng.integers(1000, 1050, rows)).astype(str),
+        "Account": pd.Series(rng.integers(100000, 101000, rows)).astype(str),
+        "AU": pd.Series(rng.integers(1, 200, rows)).astype(str),
+        "Currency": rng.choice(["USD", "EUR", "GBP", "INR"], rows),
+        "Primary Account": pd.Series(rng.integers(1, 50, rows)).astype(str),
+        "Secondary Account": pd.Series(rng.integers(1, 50, rows)).astype(str),
+        "GL Balance": gl_balance,
+        "iHub Balance": ihub_balance,
+        "Balance Difference": (gl_balance - ihub_balance).round(2),
+        "Match Status": np.where(gl_balance == ihub_balance, "Match", "Balance Break"),
+        "Comments": "",
+        "Anomaly": np.where(anomalous, "Yes", "No"),
+    })
+
+
+def write_synthetic_dataset(path, rows, break_rate=0.05, anomaly_rate=0.005, seed=42, chunk_rows=1_000_000):
+    """Write a generated dataset to .parquet or .csv in chunks, so 10M-row files fit in memory."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer = None
+    try:
+        for index, start in enumerate(range(0, rows, chunk_rows)):
+            chunk = make_matched_records_frame(min(chunk_rows, rows - start), break_rate, anomaly_rate, seed + index)
+            if path.endswith(".parquet"):
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                writer = writer or pq.ParquetWriter(path, table.schema)
+                writer.write_table(table)
+            else:
+                chunk.to_csv(path, mode="w" if index == 0 else "a", header=index == 0, index=False)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def write_ingest_inputs(rows, excel_rows, directory):
+    dataframe = make_matched_records_frame(rows)
+    paths = {
+        "csv": os.path.join(directory, "matched_records.csv"),
+        "parquet": os.path.join(directory, "matched_records.parquet"),
+        "arrow": os.path.join(directory, "matched_records.arrow"),
+    }
+    dataframe.to_csv(paths["csv"], index=False)
+    dataframe.to_parquet(paths["parquet"], index=False)
+    dataframe.to_feather(paths["arrow"])
+    if excel_rows:
+        paths["excel"] = os.path.join(directory, "matched_records.xlsx")
+        dataframe.head(excel_rows).to_excel(paths["excel"], index=False)
+    return paths
+
+
+def peak_rss_mb():
+    # ru_maxrss survives exec, so a child would report its parent's peak; VmHWM is reset on exec
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def ingest_one(path, project):
+    """Read one file in this process and report wall time and peak RSS (run in a fresh subprocess)."""
+    columns = KEY_COLUMNS + CRITERIA_COLUMNS if project else None
+    start = time.perf_counter()
+    dataframe = read_input(path, columns=columns)
+    seconds = time.perf_counter() - start
+    max_rss_mb = peak_rss_mb()
+    print(json.dumps({"rows": len(dataframe), "columns": dataframe.shape[1], "seconds": seconds, "max_rss_mb": max_rss_mb}))
+
+
+def bench_ingest(rows, excel_rows, directory=None):
+    with tempfile.TemporaryDirectory(dir=directory) as workdir:
+        print(f"writing {rows:,}-row inputs to {workdir} ...")
+        paths = write_ingest_inputs(rows, excel_rows, workdir)
+
+        print(f"{'format':<10}{'projected':<11}{'rows':>12}{'cols':>6}{'seconds':>10}{'max RSS MB':>12}{'file MB':>10}")
+        for file_format, path in paths.items():
+            for project in (False, True):
+                command = [sys.executable, __file__, "ingest-one", path] + (["--project"] if project else [])
+                result = json.loads(subprocess.run(command, check=True, capture_output=True, text=True).stdout)
+                print(f"{file_format:<10}{str(project):<11}{result['rows']:>12,}{result['columns']:>6}"
+                      f"{result['seconds']:>10.2f}{result['max_rss_mb']:>12.0f}{os.path.getsize(path) / 2**20:>10.0f}")
+
+
+def bench_persist(rows, db_url, batch_size):
+    """rows/sec for the batched writer against pandas' default to_sql on the same table."""
+    from sqlalchemy import create_engine, text
+
+    dataframe = make_matched_records_frame(rows)
+    with tempfile.TemporaryDirectory() as workdir:
+        engine = create_engine(db_url or f"sqlite:///{os.path.join(workdir, 'recon.db')}")
+        print(f"{rows:,} rows into {engine.url.render_as_string(hide_password=True)}")
+
+        def reset():
+            with engine.begin() as conn:
+                conn.execute(text(f"DELETE FROM {MATCHED_RECORDS_TABLE}"))
+
+        # Create the table (or, on Postgres, use the one from ddl.sql) before timing anything
+        dataframe.head(0).to_sql(MATCHED_RECORDS_TABLE, engine, if_exists="append", index=False)
+
+        reset()
+        start = time.perf_counter()
+        dataframe.to_sql(MATCHED_RECORDS_TABLE, engine, if_exists="append", index=False)
+        seconds = time.perf_counter() - start
+        print(f"{'to_sql':<42}{seconds:8.2f}s {rows / seconds:12,.0f} rows/s")
+
+        reset()
+        start = time.perf_counter()
+        write_matched_records(engine, dataframe, batch_size=batch_size)
+        seconds = time.perf_counter() - start
+        method = "COPY" if engine.dialect.name == "postgresql" else "batched executemany"
+        print(f"{f'write_matched_records ({method})':<42}{seconds:8.2f}s {rows / seconds:12,.0f} rows/s")
+        engine.dispose()
+
+
+def score_one(kind, path, rows, features):
+    """Load one model artifact in this process and score ``rows`` rows (run in a fresh subprocess)."""
+    start = time.perf_counter()
+    if kind == "pickle":
+        import joblib
+        model, scaler = joblib.load(path)
+        predict = lambda data: model.predict(scaler.transform(data))
+    else:
+        forest = CompactForest.load(path)
+        predict = forest.predict
+    load_seconds = time.perf_counter() - start
+
+    data = np.random.default_rng(1).normal(0, 1.5, (rows, features))
+    results = {}
+    for batch in (100, rows):
+        start = time.perf_counter()
+        for offset in range(0, rows, batch):
+            predict(data[offset:offset + batch])
+        results[batch] = rows / (time.perf_counter() - start)
+    print(json.dumps({"load_seconds": load_seconds, "max_rss_mb": peak_rss_mb(),
+                      "rows_per_sec_small": results[100], "rows_per_sec_full": results[rows]}))
+
+
+def bench_model(rows, train_rows, features, n_estimators):
+    """Pickled IsolationForest vs the memory-mapped compact export: load time, peak RSS and rows/sec."""
+    import joblib
+    from sklearn.ensemble import IsolationForest
+    from sklearn.preprocessing import StandardScaler
+
+    training = np.random.default_rng(0).normal(0, 1, (train_rows, features))
+    scaler = StandardScaler().fit(training)
+    model = IsolationForest(n_estimators=n_estimators, contamination=0.05, random_state=42)
+    model.fit(scaler.transform(training))
+    forest = CompactForest.from_sklearn(model, scaler)
+
+    check = np.random.default_rng(2).normal(0, 1.5, (10_000, features))
+    max_error = np.abs(forest.decision_function(check) - model.decision_function(scaler.transform(check))).max()
+    print(f"max |decision_function| difference on 10,000 rows: {max_error:.2e}")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        paths = {"pickle": os.path.join(workdir, "model.pkl"), "compact": os.path.join(workdir, "model.pkl.forest")}
+        joblib.dump((model, scaler), paths["pickle"])
+        forest.save(paths["compact"])
+
+        print(f"{'artifact':<10}{'file KB':>10}{'load s':>10}{'max RSS MB':>12}{'rows/s (100)':>15}{'rows/s (all)':>15}")
+        for kind, path in paths.items():
+            command = [sys.executable, __file__, "score-one", kind, path, "--rows", str(rows), "--features", str(features)]
+            result = json.loads(subprocess.run(command, check=True, capture_output=True, text=True).stdout)
+            print(f"{kind:<10}{os.path.getsize(path) / 1024:>10.0f}{result['load_seconds']:>10.3f}"
+                  f"{result['max_rss_mb']:>12.0f}{result['rows_per_sec_small']:>15,.0f}{result['rows_per_sec_full']:>15,.0f}")
+    return max_error
+
+
+def start_stub_llm(parallel, request_seconds, prefill_seconds, decode_seconds, answer_tokens):
+    """A local stand-in for Ollama's /api/chat whose latency follows a simple cost model.
+
+    Each request costs ``request_seconds`` plus ``prefill_seconds`` per prompt token and
+    ``decode_seconds`` per generated token, and at most ``parallel`` requests are served
+    at once, like a model server with that many slots.
+    """
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    from llm_client import BATCH_INSTRUCTIONS, CHARS_PER_TOKEN
+
+    slots = threading.Semaphore(parallel)
+
+    class StubHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            prompt = body["messages"][-1]["content"]
+            if isinstance(body.get("format"), dict):
+                numbers = json.loads(prompt[len(BATCH_INSTRUCTIONS):])
+                content = json.dumps({number: f"Stub comment {number}." for number in numbers})
+            else:
+                numbers = [prompt]
+                content = "Stub comment."
+            with slots:
+                time.sleep(request_seconds + len(prompt) / CHARS_PER_TOKEN * prefill_seconds
+                           + len(numbers) * answer_tokens * decode_seconds)
+            payload = json.dumps({"model": body["model"], "done": True,
+                                  "message": {"role": "assistant", "content": content}}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def bench_llm(rows, batch_sizes, parallel, request_seconds, prefill_seconds, decode_seconds, answer_tokens):
+    """Comment throughput per row vs batched prompts against the stub model."""
+    from llm_client import AsyncLLMClient
+
+    server = start_stub_llm(parallel, request_seconds, prefill_seconds, decode_seconds, answer_tokens)
+    url = f"http://127.0.0.1:{server.server_port}"
+    rng = np.random.default_rng(0)
+    prompts = [f"The balance difference is {value:.2f} while it usually is {usual:.2f}. In one sentence, suggest "
+               f"the most likely reason for the break in a general ledger reconciliation."
+               for value, usual in zip(rng.normal(0, 1000, rows), rng.normal(0, 100, rows))]
+
+    print(f"{rows} prompts, {parallel} model slot(s), {request_seconds * 1000:.0f} ms per request, "
+          f"{answer_tokens} answer tokens")
+    print(f"{'batch size':>10}{'requests':>10}{'seconds':>10}{'rows/s':>10}{'answered':>10}")
+    try:
+        for batch_size in batch_sizes:
+            client = AsyncLLMClient("stub", host=url, concurrency=parallel * 2, call_timeout=600,
+                                    total_budget=3600, max_batch_size=batch_size, answer_tokens=answer_tokens)
+            requests_sent = -(-rows // client.batch_size(prompts)) if batch_size > 1 else rows
+            start = time.perf_counter()
+            comments = client.chat_batched(prompts)
+            seconds = time.perf_counter() - start
+            answered = sum(comment is not None for comment in comments)
+            print(f"{batch_size:>10}{requests_sent:>10}{seconds:>10.2f}{rows / seconds:>10.1f}{answered:>10}")
+    finally:
+        server.shutdown()
+
+
+def bench_load_test(url, concurrency, total_requests, rows, config_path=None, profile=None):
+    """Drive /reconcile on a running server with concurrent uploads and report latency and throughput."""
+    import requests
+
+    if config_path:
+        with open(config_path, "rb") as config_file:
+            data = {"profile": profile} if profile else {}
+            requests.post(f"{url}/load/config", files={"config_file": config_file}, data=data).raise_for_status()
+
+    dataframe = make_matched_records_frame(rows)[KEY_COLUMNS + CRITERIA_COLUMNS]
+    body = dataframe.to_csv(index=False).encode()
+    form = {"profile": profile} if profile else {}
+
+    def reconcile(_):
+        start = time.perf_counter()
+        try:
+            response = requests.post(f"{url}/reconcile", files={"file": ("load_test.csv", body, "text/csv")},
+                                     data=form, timeout=600)
+            ok = response.status_code == 200 and "error" not in response.json()
+        except requests.RequestException:
+            ok = False
+        return time.perf_counter() - start, ok
+
+    print(f"{total_requests} x {rows:,}-row uploads ({len(body) / 2**20:.1f} MB) to {url}, concurrency {concurrency}")
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(reconcile, range(total_requests)))
+    seconds = time.perf_counter() - start
+
+    latencies = np.array([latency for latency, ok in results if ok])
+    errors = sum(not ok for _, ok in results)
+    if len(latencies):
+        p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+        print(f"latency p50 {p50:.3f}s  p90 {p90:.3f}s  p99 {p99:.3f}s  max {latencies.max():.3f}s")
+    print(f"throughput {len(latencies) / seconds:.2f} req/s, {len(latencies) * rows / seconds:,.0f} rows/s; errors {errors}")
+    return errors
+
+
+def best_time(run, min_seconds=MIN_STAGE_SECONDS, min_repeats=MIN_STAGE_REPEATS):
+    """Best wall time of ``run()``, repeated at least ``min_repeats`` times and for ``min_seconds`` in total."""
+    times = []
+    while len(times) < min_repeats or sum(times) < min_seconds:
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def serialize_results(dataframe, directory):
+    """What the server does with a result set: the stored Parquet part, a JSON page and NDJSON stream lines."""
+    from backend import records_payload
+    from results import write_result_part
+
+    write_result_part(directory, 0, dataframe)
+    json.dumps(records_payload(dataframe))
+    dataframe.to_json(orient="records", lines=True, date_format="iso")
+
+
+def suite_one(stage, data_path, workdir):
+    """Run one pipeline stage on the generated data in this process (run in a fresh subprocess)."""
+    import backend
+    from metrics import PipelineMetrics
+
+    backend.MODEL_PATH = os.path.join(workdir, "anomaly_model.pkl")
+    backend.metrics = PipelineMetrics(os.path.join(workdir, "metrics"))
+    backend.config = {"criteria_columns": CRITERIA_COLUMNS, "key_columns": KEY_COLUMNS,
+                      "comment_prompt": "Difference {derived_value} vs usual {historical_value}."}
+    # The LLM is stubbed out so only the pipeline itself is measured
+    backend.generate_comments = lambda prompt, derived, historical: ["benchmark comment"] * len(derived)
+    columns = KEY_COLUMNS + CRITERIA_COLUMNS
+
+    if stage == "ingest":
+        run = lambda: read_input(data_path, columns=columns)
+        rows = len(read_input(data_path, columns=columns))
+    else:
+        dataframe = read_input(data_path, columns=columns)
+        rows = len(dataframe)
+        anomaly_columns = backend.get_anamoly_columns(dataframe)
+    if stage == "train":
+        run = lambda: backend.train_anomaly_model(dataframe, anomaly_columns)
+    elif stage == "predict":
+        run = lambda: backend.predict_anomalies(dataframe, anomaly_columns)
+    elif stage == "reconcile":
+        # Reconciling updates the baselines the prefilter reads, so every measurement starts without history
+        baseline_path = backend.get_profile().baseline_path
+        if os.path.exists(baseline_path):
+            os.remove(baseline_path)
+        run = lambda: backend.process_reconciliation(dataframe)
+    elif stage == "serialize":
+        backend.process_reconciliation(dataframe)
+        result_directory = os.path.join(workdir, "serialized")
+        os.makedirs(result_directory, exist_ok=True)
+        # Serialize every row, not just the anomalies, so the stage has a meaningful amount of work
+        run = lambda: serialize_results(dataframe, result_directory)
+    seconds = best_time(run) if stage in REPEATED_STAGES else best_time(run, min_seconds=0, min_repeats=1)
+    print(json.dumps({"rows": rows, "seconds": seconds, "rows_per_sec": rows / seconds,
+                      "max_rss_mb": peak_rss_mb()}))
+
+
+def run_stage(stage, data_path, workdir):
+    command = [sys.executable, __file__, "suite-one", stage, data_path, workdir]
+    return json.loads(subprocess.run(command, check=True, capture_output=True, text=True).stdout)
+
+
+def bench_suite(rows, break_rate, anomaly_rate, stages, update_baselines, throughput_tolerance, memory_tolerance,
+                baselines_path=BASELINES_PATH, directory=None):
+    """End-to-end stage benchmarks on generated data, checked against stored baselines; returns the regression count."""
+    baselines = {}
+    if os.path.exists(baselines_path):
+        with open(baselines_path) as file:
+            baselines = json.load(file)
+    baseline_key = f"rows={rows}"
+    stored = baselines.get(baseline_key, {})
+
+    with tempfile.TemporaryDirectory(dir=directory) as workdir:
+        data_path = os.path.join(workdir, "gl_ihub.parquet")
+        write_synthetic_dataset(data_path, rows, break_rate, anomaly_rate)
+        print(f"{rows:,} rows, break rate {break_rate}, anomaly rate {anomaly_rate}")
+
+        results = {}
+        regressions = []
+        print(f"{'stage':<11}{'seconds':>9}{'rows/s':>13}{'base rows/s':>13}{'max RSS MB':>12}{'base MB':>9}")
+        # predict, reconcile and serialize score with the model trained by the train stage, so it always runs first
+        needs_model = any(stage in stages for stage in ("predict", "reconcile", "serialize"))
+        for stage in [stage for stage in SUITE_STAGES if stage in stages or (stage == "train" and needs_model)]:
+            runs = [run_stage(stage, data_path, workdir)]
+            baseline = stored.get(stage)
+            looks_slower = baseline and runs[0]["rows_per_sec"] < baseline["rows_per_sec"] * (1 - throughput_tolerance)
+            if update_baselines or looks_slower:
+                runs += [run_stage(stage, data_path, workdir) for _ in range(STAGE_RUNS - 1)]
+            result = sorted(runs, key=lambda run: run["rows_per_sec"])[len(runs) // 2]
+            results[stage] = {"rows_per_sec": result["rows_per_sec"], "max_rss_mb": result["max_rss_mb"]}
+
+            flags = ""
+            if baseline:
+                if result["rows_per_sec"] < baseline["rows_per_sec"] * (1 - throughput_tolerance):
+                    regressions.append(f"{stage}: throughput {result['rows_per_sec']:,.0f} rows/s "
+                                       f"vs baseline {baseline['rows_per_sec']:,.0f}")
+                    flags += " SLOWER"
+                if result["max_rss_mb"] > baseline["max_rss_mb"] * (1 + memory_tolerance):
+                    regressions.append(f"{stage}: peak RSS {result['max_rss_mb']:.0f} MB vs baseline {baseline['max_rss_mb']:.0f}")
+                    flags += " MEMORY"
+            print(f"{stage:<11}{result['seconds']:>9.2f}{result['rows_per_sec']:>13,.0f}"
+                  f"{baseline['rows_per_sec'] if baseline else float('nan'):>13,.0f}{result['max_rss_mb']:>12.0f}"
+                  f"{baseline['max_rss_mb'] if baseline else float('nan'):>9.0f}{flags}")
+
+    if update_baselines:
+        baselines[baseline_key] = {**stored, **results}
+        baselines["machine"] = {"platform": platform.platform(), "processor": platform.processor(),
+                                "cpus": os.cpu_count(), "python": platform.python_version()}
+        with open(baselines_path, "w") as file:
+            json.dump(baselines, file, indent=2, sort_keys=True)
+        print(f"baselines for {baseline_key} written to {baselines_path}")
+        return 0
+
+    if not stored:
+        print(f"no baselines for {baseline_key}; run with --update-baselines to record them")
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return len(regressions)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    match_status = subparsers.add_parser("match-status", help="vectorized vs row-wise Match Status")
+    match_status.add_argument("--rows", type=int, default=1_000_000)
+    match_status.add_argument("--legacy-rows", type=int, default=100_000,
+                              help="rows to run through the slow row-wise path for parity")
+
+    ingest = subparsers.add_parser("ingest", help="ingest time and peak RSS per input format")
+    ingest.add_argument("--rows", type=int, default=5_000_000)
+    ingest.add_argument("--excel-rows", type=int, default=100_000,
+                        help="xlsx is capped at 1,048,576 rows and is far slower, so it gets a smaller sample")
+    ingest.add_argument("--dir", default=None, help="where to write the generated inputs")
+
+    ingest_one_parser = subparsers.add_parser("ingest-one", help=argparse.SUPPRESS)
+    ingest_one_parser.add_argument("path")
+    ingest_one_parser.add_argument("--project", action="store_true")
+
+    persist = subparsers.add_parser("persist", help="rows/sec writing matched_records")
+    persist.add_argument("--rows", type=int, default=1_000_000)
+    persist.add_argument("--db-url", default=None,
+                         help="SQLAlchemy URL of a database with matched_records (default: temporary SQLite file)")
+    persist.add_argument("--batch-size", type=int, default=50_000)
+
+    model = subparsers.add_parser("model", help="pickled vs compact anomaly model: load, RSS and rows/sec")
+    model.add_argument("--rows", type=int, default=1_000_000)
+    model.add_argument("--train-rows", type=int, default=100_000)
+    model.add_argument("--features", type=int, default=3)
+    model.add_argument("--n-estimators", type=int, default=100)
+    model.add_argument("--tolerance", type=float, default=1e-9)
+
+    score_one_parser = subparsers.add_parser("score-one", help=argparse.SUPPRESS)
+    score_one_parser.add_argument("kind", choices=["pickle", "compact"])
+    score_one_parser.add_argument("path")
+    score_one_parser.add_argument("--rows", type=int, default=1_000_000)
+    score_one_parser.add_argument("--features", type=int, default=3)
+
+    load_test = subparsers.add_parser("load-test", help="concurrent /reconcile requests against a running server")
+    load_test.add_argument("--url", default="http://127.0.0.1:5000")
+    load_test.add_argument("--concurrency", type=int, default=8)
+    load_test.add_argument("--requests", type=int, default=64)
+    load_test.add_argument("--rows", type=int, default=10_000, help="rows per uploaded file")
+    load_test.add_argument("--config", default=None, help="config.json to load before the run")
+    load_test.add_argument("--profile", default=None)
+
+    llm = subparsers.add_parser("llm", help="per-row vs batched LLM commenting against a local stub model")
+    llm.add_argument("--rows", type=int, default=200)
+    llm.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 5, 20, 50])
+    llm.add_argument("--parallel", type=int, default=1, help="requests the stub model serves at once")
+    llm.add_argument("--request-ms", type=float, default=50, help="fixed cost of every request")
+    llm.add_argument("--prefill-ms", type=float, default=0.2, help="cost per prompt token")
+    llm.add_argument("--decode-ms", type=float, default=2, help="cost per generated token")
+    llm.add_argument("--answer-tokens", type=int, default=30)
+
+    generate = subparsers.add_parser("generate", help="write a synthetic GL vs iHub dataset (.parquet or .csv)")
+    generate.add_argument("path")
+    generate.add_argument("--rows", type=int, default=1_000_000)
+    generate.add_argument("--break-rate", type=float, default=0.05)
+    generate.add_argument("--anomaly-rate", type=float, default=0.005)
+    generate.add_argument("--seed", type=int, default=42)
+
+    suite = subparsers.add_parser("suite", help="pipeline stage throughput and memory against stored baselines")
+    suite.add_argument("--rows", type=int, default=200_000)
+    suite.add_argument("--break-rate", type=float, default=0.05)
+    suite.add_argument("--anomaly-rate", type=float, default=0.005)
+    suite.add_argument("--stages", nargs="+", choices=SUITE_STAGES, default=SUITE_STAGES)
+    suite.add_argument("--update-baselines", action="store_true",
+                       help="record this run as the baseline for --rows instead of checking against it")
+    suite.add_argument("--throughput-tolerance", type=float, default=0.3,
+                       help="fail when rows/s drops by more than this fraction")
+    suite.add_argument("--memory-tolerance", type=float, default=0.2,
+                       help="fail when peak RSS grows by more than this fraction")
+    suite.add_argument("--baselines", default=BASELINES_PATH)
+    suite.add_argument("--dir", default=None, help="where to write the generated data")
+
+    suite_one_parser = subparsers.add_parser("suite-one", help=argparse.SUPPRESS)
+    suite_one_parser.add_argument("stage", choices=SUITE_STAGES)
+    suite_one_parser.add_argument("data_path")
+    suite_one_parser.add_argument("workdir")
+
+    args = parser.parse_args()
+    if args.benchmark == "match-status":
+        raise SystemExit(1 if bench_match_status(args.rows, args.legacy_rows) else 0)
+    elif args.benchmark == "ingest":
+        bench_ingest(args.rows, args.excel_rows, args.dir)
+    elif args.benchmark == "ingest-one":
+        ingest_one(args.path, args.project)
+    elif args.benchmark == "persist":
+        bench_persist(args.rows, args.db_url, args.batch_size)
+    elif args.benchmark == "model":
+        raise SystemExit(1 if bench_model(args.rows, args.train_rows, args.features, args.n_estimators) > args.tolerance else 0)
+    elif args.benchmark == "load-test":
+        raise SystemExit(1 if bench_load_test(args.url, args.concurrency, args.requests, args.rows,
+                                              args.config, args.profile) else 0)
+    elif args.benchmark == "llm":
+        bench_llm(args.rows, args.batch_sizes, args.parallel, args.request_ms / 1000, args.prefill_ms / 1000,
+                  args.decode_ms / 1000, args.answer_tokens)
+    elif args.benchmark == "generate":
+        write_synthetic_dataset(args.path, args.rows, args.break_rate, args.anomaly_rate, args.seed)
+    elif args.benchmark == "suite":
+        raise SystemExit(1 if bench_suite(args.rows, args.break_rate, args.anomaly_rate, args.stages,
+                                          args.update_baselines, args.throughput_tolerance, args.memory_tolerance,
+                                          args.baselines, args.dir) else 0)
+    elif args.benchmark == "suite-one":
+        suite_one(args.stage, args.data_path, args.workdir)
+    elif args.benchmark == "score-one":
+        score_one(args.kind, args.path, args.rows, args.features)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,106 @@
+import atexit
+import concurrent.futures
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
 import pytest
 import json
+import joblib
+import numpy as np
 import pandas as pd
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from io import BytesIO
-from backend import app, process_reconciliation, train_anomaly_model, predict_anomalies
+from sqlalchemy import create_engine
+
+# The backend keeps its models, caches, results and metrics under RECON_DATA_DIR; keep the tests' out of the tree
+TEST_DATA_DIR = tempfile.mkdtemp(prefix="recon-tests-")
+os.environ.setdefault("RECON_DATA_DIR", TEST_DATA_DIR)
+atexit.register(shutil.rmtree, TEST_DATA_DIR, ignore_errors=True)
+
+import backend
+from baselines import BaselineStore
+from comment_cache import CommentCache
+from compact_forest import CompactForest
+from group_models import GroupedAnomalyModel
+from ingest import iter_input_chunks, read_input
+from jobs import JobManager
+import join
+import llm_client
+from llm_client import BATCH_INSTRUCTIONS, AsyncLLMClient
+from metrics import PipelineMetrics
+from model_registry import ModelRegistry
+from persistence import MATCHED_RECORDS_COLUMNS, MatchedRecordWriter
+from prefilter import resolve_fast_path
+from profiles import ColumnPlan, ProfileRegistry
+from training import IncrementalTrainer
+from backend import app, determine_match_status, process_reconciliation, train_anomaly_model, predict_anomalies
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    """Minimal /api/chat stand-in: "slow" prompts stall, "fail" always errors, "flaky" errors once."""
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        prompt = body["messages"][-1]["content"]
+        if isinstance(body.get("format"), dict):
+            return self.answer_batch(body, json.loads(prompt[len(BATCH_INSTRUCTIONS):]))
+        self.server.prompts.append(prompt)
+
+        if prompt == "slow":
+            time.sleep(2)
+        if prompt == "fail" or (prompt == "flaky" and self.server.prompts.count(prompt) == 1):
+            self.send_response(500)
+            self.end_headers()
+            self.wfile.write(b'{"error": "model crashed"}')
+            return
+
+        payload = json.dumps({
+            "model": body["model"],
+            "message": {"role": "assistant", "content": f" comment for {prompt} "},
+            "done": True,
+        }).encode()
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client already gave up on a slow response
+
+    def answer_batch(self, body, requests):
+        """Batched prompts: "fail" rows are never answered, "flaky" ones only the second time."""
+        self.server.batches.append(list(requests.values()))
+        answers = {}
+        for number, prompt in requests.items():
+            self.server.prompts.append(prompt)
+            if prompt != "fail" and not (prompt == "flaky" and self.server.prompts.count(prompt) == 1):
+                answers[number] = f"comment for {prompt}"
+        payload = json.dumps({"model": body["model"], "done": True,
+                              "message": {"role": "assistant", "content": json.dumps(answers)}}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def fake_ollama():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeOllamaHandler)
+    server.daemon_threads = True
+    server.prompts = []
+    server.batches = []
+    server.url = f"http://127.0.0.1:{server.server_port}"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
 
 @pytest.fixture
 def client():
@@ -47,3 +145,802 @@ def test_get_options(client):
     response = client.get("/chat/options")
     assert response.status_code == 200
     assert isinstance(response.get_json(), dict)
+
+def test_match_status_first_nonzero_difference():
+    df = pd.DataFrame({
+        "Difference Balance": [0, 5, 0, float("nan"), 0],
+        "Difference Quantity": [0, 1, -2, 0, None],
+    })
+    status = determine_match_status(df, ["Difference Balance", "Difference Quantity"])
+    assert list(status) == ["Match", "Balance Break", "Quantity Break", "Balance Break", "Quantity Break"]
+
+def test_model_registry_reloads_only_when_artifact_changes(tmp_path):
+    registry = ModelRegistry()
+    path = str(tmp_path / "model.pkl")
+    assert registry.get(path) is None
+
+    registry.publish(path, {"version": 1})
+    assert registry.get(path) == {"version": 1}
+    assert registry.get(path) == {"version": 1}
+    assert registry.stats()["hits"] == 2
+
+    joblib.dump({"version": 2}, path)
+    os.utime(path, ns=(0, 0))
+    assert registry.get(path) == {"version": 2}
+    assert registry.stats()["misses"] == 1
+
+def test_reconcile_stream_ndjson(client, monkeypatch, tmp_path):
+    monkeypatch.setattr(backend, "MODEL_PATH", str(tmp_path / "missing.pkl"))
+    monkeypatch.setattr(backend, "config", {"criteria_columns": ["Balance"], "key_columns": ["Account"],
+                                            "compare_current_criteria_column": False, "db_columns": "GL,iHub"})
+    monkeypatch.setattr(backend, "predict_anomalies", lambda df, columns, model_path=None: ["Yes"] * len(df))
+    staged = []
+    stage_upload = backend.stage_upload
+    monkeypatch.setattr(backend, "stage_upload", lambda file: staged.append(stage_upload(file)) or staged[-1])
+    csv = b"Account,GL Balance,iHub Balance\nA,100,100\nB,200,195\nC,300,310\n"
+
+    response = client.post("/reconcile/stream", data={"file": (BytesIO(csv), "test.csv"), "chunk_size": "2"})
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+    assert response.mimetype == "application/x-ndjson"
+    assert [(line["Account"], line["Anomaly"]) for line in lines[:-1]] == [("B", "Yes"), ("C", "Yes")]
+    assert lines[-1]["processed_count"] == 3
+    assert lines[-1]["anomalous_count"] == 2
+    assert not os.path.exists(staged[-1])
+
+    # A response that is closed without ever being read still removes its staged upload
+    response = client.post("/reconcile/stream", data={"file": (BytesIO(csv), "test.csv")}, buffered=False)
+    assert os.path.exists(staged[-1])
+    response.close()
+    assert not os.path.exists(staged[-1])
+
+def test_read_input_projects_configured_columns(tmp_path):
+    df = pd.DataFrame({" GL Balance": [1.0, 2.0], "iHub Balance": [1.0, 3.0], "Notes": ["a", "b"]})
+    df.to_parquet(tmp_path / "input.parquet")
+    df.to_csv(tmp_path / "input.csv", index=False)
+    df.to_feather(tmp_path / "input.arrow")
+
+    for name in ["input.parquet", "input.csv", "input.arrow"]:
+        result = read_input(str(tmp_path / name), columns=["GL Balance", "iHub Balance"])
+        assert [col.strip() for col in result.columns] == ["GL Balance", "iHub Balance"]
+        assert result.shape == (2, 2)
+
+def test_chunked_csv_reads_match_whole_file_reads(tmp_path):
+    path = tmp_path / "input.csv"
+    path.write_text("Account, GL Balance,Notes\n1001,1.5,a\n1002,2,b\n1003,3,c\n")
+
+    whole = read_input(str(path), columns=["Account", "GL Balance"])
+    chunks = list(iter_input_chunks(str(path), str(path), 2, ["Account", "GL Balance"]))
+    assert [len(chunk) for chunk in chunks] == [2, 1]
+    pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True), whole)
+    (tmp_path / "legacy.xls").write_bytes(b"\xd0\xcf\x11\xe0legacy")  # no .xls reader is installed
+    with pytest.raises(ValueError, match="Unsupported"):
+        read_input(str(tmp_path / "legacy.xls"))
+
+def test_reconcile_parquet_upload(client, monkeypatch, tmp_path):
+    monkeypatch.setattr(backend, "MODEL_PATH", str(tmp_path / "missing.pkl"))
+    monkeypatch.setattr(backend, "config", {"criteria_columns": ["GL Balance", "iHub Balance"]})
+    parquet_buffer = BytesIO()
+    pd.DataFrame({"GL Balance": [100, 200], "iHub Balance": [100, 195], "Notes": ["x", "y"]}).to_parquet(parquet_buffer)
+    parquet_buffer.seek(0)
+
+    response = client.post("/reconcile", data={"file": (parquet_buffer, "test.parquet")})
+    assert response.get_json()["processed_count"] == 2
+
+def test_generate_comments_deduplicates_and_caches(monkeypatch, tmp_path, fake_ollama):
+    monkeypatch.setattr(backend, "llm_client", AsyncLLMClient("mistral", host=fake_ollama.url))
+    monkeypatch.setattr(backend, "comment_cache", CommentCache(str(tmp_path / "comments.sqlite")))
+
+    comments = backend.generate_comments("{derived_value} vs {historical_value}", [5, 5, 7], [0, 0, 0])
+    assert comments == ["comment for 5 vs 0", "comment for 5 vs 0", "comment for 7 vs 0"]
+    assert len(fake_ollama.prompts) == 2
+
+    assert backend.generate_comments("{derived_value} vs {historical_value}", [7, 5], [0, 0]) == comments[1:][::-1]
+    assert len(fake_ollama.prompts) == 2
+    assert backend.comment_cache.stats()["hits"] == 2
+
+def test_llm_client_retries_and_falls_back(fake_ollama, monkeypatch):
+    opened, closed = [], []
+    ollama_client = llm_client.ollama.AsyncClient
+
+    class TrackedClient(ollama_client):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            opened.append(self)
+
+        async def close(self):
+            closed.append(self)
+            await super().close()
+
+    monkeypatch.setattr(llm_client.ollama, "AsyncClient", TrackedClient)
+    client = AsyncLLMClient("mistral", host=fake_ollama.url, concurrency=2, call_timeout=0.5,
+                            retries=1, backoff=0.01, total_budget=5)
+    comments = client.chat_many(["ok", "flaky", "fail", "slow"])
+
+    assert comments == ["comment for ok", "comment for flaky", None, None]
+    assert fake_ollama.prompts.count("flaky") == 2
+    assert fake_ollama.prompts.count("fail") == 2
+    # One connection pool per call, shared by every request and closed afterwards
+    assert len(opened) == 1 and closed == opened
+
+def test_llm_client_total_budget(fake_ollama):
+    client = AsyncLLMClient("mistral", host=fake_ollama.url, concurrency=1, call_timeout=5,
+                            retries=0, total_budget=0.5)
+    start = time.monotonic()
+    assert client.chat_many(["slow", "ok"]) == [None, None]
+    assert time.monotonic() - start < 2
+
+def test_reconcile_job_status_and_results(client, monkeypatch, tmp_path):
+    monkeypatch.setattr(backend, "MODEL_PATH", str(tmp_path / "missing.pkl"))
+    monkeypatch.setattr(backend, "config", {"criteria_columns": ["GL Balance", "iHub Balance"]})
+    monkeypatch.setattr(backend, "job_manager", JobManager(str(tmp_path / "jobs"), max_workers=1))
+    csv_buffer = BytesIO(b"Account,GL Balance,iHub Balance\nA,100,100\nB,200,195\nC,300,310\n")
+
+    response = client.post("/jobs/reconcile", data={"file": (csv_buffer, "test.csv"), "chunk_size": "2"})
+    assert response.status_code == 202
+    # Jobs never run in a fork of the threaded web process
+    assert backend.job_manager._get_executor()._mp_context.get_start_method() == "forkserver"
+    job_id = response.get_json()["job_id"]
+
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        status = client.get(f"/jobs/{job_id}").get_json()
+        if status["status"] in ("completed", "failed"):
+            break
+        time.sleep(0.1)
+
+    assert status["status"] == "completed"
+    assert status["processed_count"] == 3
+    assert status["chunks_done"] == 2
+    results = client.get(f"/jobs/{job_id}/results?page=1&page_size=10").get_json()
+    assert results["anomalous_records"] == []
+    assert client.get("/jobs/unknown").status_code == 404
+
+def exit_without_a_status(*args):
+    os._exit(1)  # a job process killed outright, as by the OOM killer
+
+def wait_for_job_status(job_manager, job_id):
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        status = job_manager.status(job_id)
+        if status["status"] in ("completed", "failed"):
+            return status
+        time.sleep(0.1)
+    return status
+
+def test_jobs_whose_process_dies_fail_and_the_pool_recovers(monkeypatch, tmp_path):
+    import jobs
+
+    monkeypatch.setattr(backend, "MODEL_PATH", str(tmp_path / "missing.pkl"))
+    monkeypatch.setattr(backend, "config", {"criteria_columns": ["GL Balance", "iHub Balance"]})
+    manager = JobManager(str(tmp_path / "jobs"), max_workers=1)
+    profile = backend.get_profile()
+
+    def staged_input(name):
+        path = tmp_path / name
+        path.write_text("Account,GL Balance,iHub Balance\nA,100,100\nB,200,195\n")
+        return str(path)
+
+    monkeypatch.setattr(jobs, "run_job", exit_without_a_status)
+    dead_input = staged_input("dead.csv")
+    status = wait_for_job_status(manager, manager.submit("reconcile", dead_input, "dead.csv", profile, 10))
+    assert status["status"] == "failed" and "stopped unexpectedly" in status["error"]
+    assert not os.path.exists(dead_input)
+
+    monkeypatch.undo()
+    monkeypatch.setattr(backend, "MODEL_PATH", str(tmp_path / "missing.pkl"))
+    monkeypatch.setattr(backend, "config", {"criteria_columns": ["GL Balance", "iHub Balance"]})
+    status = wait_for_job_status(manager, manager.submit("reconcile", staged_input("next.csv"), "next.csv", profile, 10))
+    assert status["status"] == "completed" and status["processed_count"] == 2
+
+def test_config_profiles_are_isolated(client, monkeypatch, tmp_path):
+    monkeypatch.setattr(backend, "profile_registry", ProfileRegistry(str(tmp_path / "models")))
+    team_a = {"criteria_columns": ["GL Balance", "iHub Balance"]}
+    team_b = {"criteria_columns": ["Ledger", "Bank"], "next_step_options": {"1": "Send an Email"}}
+    for name, profile_config in [("team-a", team_a), ("team-b", team_b)]:
+        config_file = BytesIO(json.dumps(profile_config).encode())
+        response = client.post("/load/config", data={"config_file": (config_file, "config.json"), "profile": name})
+        assert response.get_json()["profile"] == name
+
+    profile_a, profile_b = backend.get_profile("team-a"), backend.get_profile("team-b")
+    assert profile_a.model_path != profile_b.model_path
+    assert profile_b.plan.input_columns == ["Ledger", "Bank"]
+    assert client.get("/chat/options?profile=team-b").get_json() == {"1": "Send an Email"}
+
+    csv_buffer = BytesIO(b"Ledger,Bank\n1,1\n2,3\n")
+    response = client.post("/reconcile", data={"file": (csv_buffer, "test.csv"), "profile": "team-b"})
+    assert response.get_json()["processed_count"] == 2
+
+    response = client.post("/reconcile", data={"file": (BytesIO(b"a\n1\n"), "test.csv"), "profile": "missing"})
+    assert "Unknown config profile" in response.get_json()["error"]
+
+def test_matched_records_are_persisted_in_background(monkeypatch, tmp_path):
+    sqlite_engine = create_engine(f"sqlite:///{tmp_path / 'recon.db'}")
+    monkeypatch.setattr(backend, "MODEL_PATH", str(tmp_path / "missing.pkl"))
+    monkeypatch.setattr(backend, "record_writer", MatchedRecordWriter(sqlite_engine, batch_size=2))
+    monkeypatch.setattr(backend, "config", {"criteria_columns": ["GL Balance", "iHub Balance"],
+                                            "persist_matched_records": True})
+    monkeypatch.setattr(backend, "predict_anomalies", lambda df, cols, model_path=None: ["Yes"] * len(df))
+    monkeypatch.setattr(backend, "generate_comments", lambda prompt, derived, historical: ["check"] * len(derived))
+    df = pd.DataFrame({"Company": ["A", "B", "C"], "GL Balance": [1, 2, 3], "iHub Balance": [1, 5, 3]})
+
+    processed_count, anomalous_count, _ = backend.process_reconciliation(df)
+    backend.record_writer.flush()
+
+    stored = pd.read_sql_query("SELECT * FROM matched_records", sqlite_engine)
+    assert (processed_count, anomalous_count) == (3, 1)
+    assert list(stored["Company"]) == ["A", "C"]
+    assert set(stored["Anomaly"]) == {"No"}
+
+def test_incremental_training_reads_only_new_history(tmp_path):
+    sqlite_engine = create_engine(f"sqlite:///{tmp_path / 'recon.db'}")
+    rng = np.random.default_rng(0)
+    history = pd.DataFrame({"id": np.arange(1, 301), "GL Balance": rng.normal(100, 10, 300)})
+    history["iHub Balance"] = history["GL Balance"]
+    history.iloc[:200].to_sql("matched_records", sqlite_engine, index=False)
+
+    trainer = IncrementalTrainer(str(tmp_path / "model.pkl"), sample_size=50, chunk_size=64)
+    prepare = lambda chunk: chunk.to_numpy()
+    model, scaler, new_rows = trainer.train(sqlite_engine, ["GL Balance", "iHub Balance"], prepare)
+    assert model is not None and new_rows == 200
+    assert scaler.n_samples_seen_ == 200
+
+    assert trainer.train(sqlite_engine, ["GL Balance", "iHub Balance"], prepare)[2] == 0
+
+    history.iloc[200:].to_sql("matched_records", sqlite_engine, index=False, if_exists="append")
+    model, scaler, new_rows = trainer.train(sqlite_engine, ["GL Balance", "iHub Balance"], prepare)
+    assert new_rows == 100
+    assert scaler.n_samples_seen_ == 300
+    assert len(trainer.load_state(("GL Balance", "iHub Balance"))["sample"]) == 50
+
+def test_history_training_keeps_a_grouped_profile_grouped(monkeypatch, tmp_path):
+    sqlite_engine = create_engine(f"sqlite:///{tmp_path / 'recon.db'}")
+    rng = np.random.default_rng(0)
+    history = pd.DataFrame({"id": np.arange(1, 201), "Company": ["small", "large"] * 100,
+                            "GL Balance": rng.normal(100, 10, 200), "iHub Balance": rng.normal(100, 10, 200)})
+    history.to_sql("matched_records", sqlite_engine, index=False)
+    monkeypatch.setattr(backend, "engine", sqlite_engine)
+    monkeypatch.setattr(backend, "MODEL_PATH", str(tmp_path / "model.pkl"))
+    monkeypatch.setattr(backend, "config", {"criteria_columns": ["GL Balance", "iHub Balance"],
+                                            "group_model_columns": ["Company"]})
+    monkeypatch.setattr(backend, "MIN_GROUP_SIZE", 50)
+
+    with app.test_request_context():
+        assert backend.train_model_from_history(backend.get_profile()).get_json()["new_rows"] == 200
+    model = backend.model_registry.get(str(tmp_path / "model.pkl"))
+    assert isinstance(model, GroupedAnomalyModel) and model.stats()["group_models"] == 2
+    state = IncrementalTrainer(str(tmp_path / "model.pkl")).load_state(
+        (tuple(backend.get_profile().plan.input_columns), ("Company",)))
+    assert sorted(set(state["sample_keys"][:, 0])) == ["large", "small"]
+
+def test_history_training_selects_only_matched_records_columns(monkeypatch, tmp_path):
+    sqlite_engine = create_engine(f"sqlite:///{tmp_path / 'recon.db'}")
+    rng = np.random.default_rng(3)
+    history = pd.DataFrame({"id": np.arange(1, 101), "Account": ["A", "B"] * 50,
+                            "GL Balance": rng.normal(100, 10, 100), "iHub Balance": rng.normal(100, 10, 100)})
+    history.to_sql("matched_records", sqlite_engine, index=False)
+    monkeypatch.setattr(backend, "engine", sqlite_engine)
+    monkeypatch.setattr(backend, "MODEL_PATH", str(tmp_path / "model.pkl"))
+    monkeypatch.setattr(backend, "config", {"criteria_columns": ["Balance"], "key_columns": ["Account"],
+                                            "compare_current_criteria_column": False, "db_columns": "GL,iHub"})
+    selected = []
+    iter_new_rows = IncrementalTrainer.iter_new_rows
+    monkeypatch.setattr(IncrementalTrainer, "iter_new_rows", lambda trainer, connection, columns, high_water_mark:
+                        selected.append(list(columns)) or iter_new_rows(trainer, connection, columns, high_water_mark))
+
+    with app.test_request_context():
+        assert backend.train_model_from_history(backend.get_profile()).get_json()["new_rows"] == 100
+    # "Balance" is only a criteria name in the config; it is not a column of the table
+    assert selected == [["Account", "GL Balance", "iHub Balance"]]
+    assert backend.model_registry.get(str(tmp_path / "model.pkl")) is not None
+
+def test_group_models_score_by_group_with_global_fallback(monkeypatch):
+    import group_models
+
+    contexts = []
+    pool = concurrent.futures.ProcessPoolExecutor
+    monkeypatch.setattr(group_models.concurrent.futures, "ProcessPoolExecutor",
+                        lambda max_workers, mp_context: contexts.append(mp_context.get_start_method()) or
+                        pool(max_workers=max_workers, mp_context=mp_context))
+    rng = np.random.default_rng(1)
+    df = pd.DataFrame({
+        "Company": ["small"] * 100 + ["large"] * 100,
+        "Balance Difference": np.concatenate([rng.normal(0, 1, 100), rng.normal(10_000, 100, 100)]),
+    })
+    model = GroupedAnomalyModel.fit(df, ["Balance Difference"], ["Company"], min_group_size=50, max_workers=2)
+    assert model.stats()["group_models"] == 2
+    assert contexts == ["forkserver"]  # never a fork of the (threaded) caller
+
+    scoring = pd.DataFrame({"Company": ["small", "large", "unseen"], "Balance Difference": [10_000.0] * 3})
+    predictions = model.predict(scoring, ["Balance Difference"])
+    # 10,000 is far out for the small account, but normal for the large one and for the global model
+    assert list(predictions) == [-1, 1, 1]
+
+def test_baseline_store_updates_incrementally(tmp_path):
+    store = BaselineStore(str(tmp_path / "baselines.parquet"), ["Account"], last_n=3)
+    first = pd.DataFrame({"Account": ["A", "A", "B"], "Balance Difference": [1.0, 3.0, 10.0]})
+    second = pd.DataFrame({"Account": ["A", "A", "C"], "Balance Difference": [5.0, 7.0, None]})
+    store.update(first, ["Balance Difference"])
+    store.update(second, ["Balance Difference"])
+
+    everything = pd.concat([first, second]).dropna()
+    expected = everything.groupby("Account")["Balance Difference"]
+    baselines = store.lookup(pd.DataFrame({"Account": ["A", "B", "C"]}), "Balance Difference")
+
+    assert list(baselines["count"][:2]) == [4, 1]
+    assert np.allclose(baselines["mean"][:2], expected.mean())
+    assert np.allclose(baselines["std"][:2], expected.std(ddof=0))
+    assert baselines["rolling_mean"][0] == pytest.approx(5.0)  # last three: 7, 5, 3
+    assert np.isnan(baselines["mean"][2])
+
+def test_baseline_keys_ignore_float_upcasts_from_blank_keys(tmp_path):
+    store = BaselineStore(str(tmp_path / "baselines.parquet"), ["Account"])
+    store.update(pd.DataFrame({"Account": [1001, 1002], "Balance Difference": [1.0, 2.0]}), ["Balance Difference"])
+    store.update(pd.DataFrame({"Account": [1001, None], "Balance Difference": [3.0, 4.0]}), ["Balance Difference"])
+
+    assert sorted(store.load()["Account"].dropna()) == ["1001", "1002"]
+    baselines = store.lookup(pd.DataFrame({"Account": [1001.0, 1002.0, np.nan]}), "Balance Difference")
+    assert list(baselines["count"][:2]) == [2, 1]
+
+def test_group_keys_ignore_float_upcasts_from_blank_keys():
+    rng = np.random.default_rng(0)
+    history = pd.DataFrame({"Company": [7] * 60, "Balance Difference": rng.normal(0, 1, 60)})
+    model = GroupedAnomalyModel.fit(history, ["Balance Difference"], ["Company"], max_workers=1)
+    # A blank key turns the column into floats (7.0), which must still be company 7
+    scoring = pd.DataFrame({"Company": [7.0, np.nan], "Balance Difference": [0.0, 0.0]})
+    assert ("7",) in model.group_index and list(model.predict(scoring, ["Balance Difference"])) == [1, 1]
+
+def test_chunked_runs_write_the_baseline_store_once(monkeypatch, tmp_path):
+    monkeypatch.setattr(backend, "MODEL_PATH", str(tmp_path / "missing.pkl"))
+    monkeypatch.setattr(backend, "config", {"criteria_columns": ["Balance"], "key_columns": ["Account"],
+                                            "compare_current_criteria_column": False, "db_columns": "GL,iHub"})
+    applied = []
+    apply = BaselineStore.apply
+    monkeypatch.setattr(BaselineStore, "apply", lambda store, aggregates: applied.append(aggregates) or
+                        apply(store, aggregates))
+    frame = pd.DataFrame({"Account": ["A", "B", "A", "B", "A"], "GL Balance": [1.0, 2.0, 3.0, 4.0, 5.0],
+                          "iHub Balance": [0.0, 0.0, 0.0, 0.0, 0.0]})
+
+    backend.process_reconciliation_chunks(backend.iter_frame_chunks(frame, 2))
+    assert len(applied) == 1
+    baselines = backend.get_baseline_store(backend.get_profile()).lookup(
+        pd.DataFrame({"Account": ["A", "B"]}), "Difference Balance")
+    assert list(baselines["count"]) == [3, 2] and list(baselines["mean"]) == [3.0, 3.0]
+
+def test_files_without_a_configured_key_column_keep_their_own_baselines(monkeypatch, tmp_path):
+    monkeypatch.setattr(backend, "MODEL_PATH", str(tmp_path / "missing.pkl"))
+    monkeypatch.setattr(backend, "config", {"criteria_columns": ["Balance"], "key_columns": ["Account", "Company"],
+                                            "compare_current_criteria_column": False, "db_columns": "GL,iHub"})
+    frame = pd.DataFrame({"Account": ["A", "B", "A"], "GL Balance": [1.0, 2.0, 3.0], "iHub Balance": [0.0, 0.0, 0.0]})
+
+    processed_count, _, _ = backend.process_reconciliation(frame.copy())
+    backend.process_reconciliation_chunks(backend.iter_frame_chunks(frame.copy(), 2))
+    assert processed_count == 3
+
+    # The rows are kept by Account alone, away from the store keyed on Account and Company
+    profile = backend.get_profile()
+    store = backend.get_baseline_store(profile, ["Account"])
+    assert store.key_columns == ["Account"] and store.path == str(tmp_path / "baselines.Account.parquet")
+    assert not os.path.exists(profile.baseline_path)
+    baselines = store.lookup(pd.DataFrame({"Account": ["A", "B"]}), "Difference Balance")
+    assert list(baselines["count"]) == [4, 2]
+
+def test_prefilter_settles_rows_of_files_without_a_configured_key_column(monkeypatch, tmp_path):
+    monkeypatch.setattr(backend, "MODEL_PATH", str(tmp_path / "missing.pkl"))
+    monkeypatch.setattr(backend, "config", {"criteria_columns": ["Balance"], "key_columns": ["Account", "Company"],
+                                            "compare_current_criteria_column": False, "db_columns": "GL,iHub",
+                                            "prefilter_min_history": 30})
+    rng = np.random.default_rng(4)
+    history = pd.DataFrame({"Account": ["A"] * 50, "Difference Balance": rng.normal(10, 1, 50)})
+    backend.get_baseline_store(backend.get_profile(), ["Account"]).update(history, ["Difference Balance"])
+
+    stage_counts = {}
+    frame = pd.DataFrame({"Account": ["A", "A"], "GL Balance": [20.0, 500.0], "iHub Balance": [10.0, 0.0]})
+    backend.reconcile_frame(frame, backend.get_profile(), stage_counts)
+    assert stage_counts["within_baseline"] == 1 and stage_counts["model_scored"] == 1
+
+def test_config_switches_accept_strings():
+    base = {"criteria_columns": ["GL Balance", "iHub Balance"]}
+    assert ColumnPlan.from_config({**base, "prefilter": "false"}).prefilter is False
+    assert ColumnPlan.from_config({**base, "prefilter": "0"}).prefilter is False
+    assert ColumnPlan.from_config({**base, "prefilter": "Yes"}).prefilter is True
+    assert ColumnPlan.from_config(base).prefilter is True
+    with pytest.raises(ValueError, match="true/false"):
+        ColumnPlan.from_config({**base, "prefilter": "sometimes"})
+
+def test_prefilter_only_sends_ambiguous_rows_to_the_model(monkeypatch, tmp_path):
+    monkeypatch.setattr(backend, "MODEL_PATH", str(tmp_path / "model.pkl"))
+    monkeypatch.setattr(backend, "config", {"criteria_columns": ["GL Balance", "iHub Balance"],
+                                            "key_columns": ["Account"], "prefilter_min_history": 30})
+    rng = np.random.default_rng(2)
+    history = pd.DataFrame({"Account": ["A"] * 50 + ["B"] * 10, "Balance Difference": rng.normal(10, 1, 60)})
+    profile = backend.get_profile()
+    backend.get_baseline_store(profile).update(history, ["Balance Difference"])
+
+    scored = []
+    monkeypatch.setattr(backend, "predict_anomalies",
+                        lambda df, cols, model_path=None: scored.extend(df["Account"]) or ["Yes"] * len(df))
+    monkeypatch.setattr(backend, "generate_comments", lambda prompt, derived, historical: ["check"] * len(derived))
+    df = pd.DataFrame({"Account": ["A", "A", "A", "B"], "GL Balance": [5.0, 20.0, 500.0, 20.0],
+                       "iHub Balance": [5.0, 10.0, 0.0, 10.0]})
+    stage_counts = {}
+    backend.reconcile_frame(df, profile, stage_counts)
+
+    # Exact match and in-band row for A are settled; A's outlier and B (too little history) are scored
+    assert list(df["Anomaly"]) == ["No", "No", "Yes", "Yes"]
+    assert scored == ["A", "B"]
+    assert stage_counts == {"input": 4, "exact_match": 1, "within_baseline": 1, "model_scored": 2, "anomalous": 2}
+
+def test_compact_forest_matches_sklearn_scores(monkeypatch, tmp_path):
+    monkeypatch.setattr(backend, "MODEL_PATH", str(tmp_path / "model.pkl"))
+    rng = np.random.default_rng(3)
+    history = pd.DataFrame(rng.normal(0, 1, (2000, 3)), columns=["a", "b", "c"])
+    model = train_anomaly_model(history, ["a", "b", "c"])
+    scaler = backend.model_registry.get(backend.MODEL_PATH)[1]
+
+    incoming = pd.DataFrame(rng.normal(0, 3, (500, 3)), columns=["a", "b", "c"])
+    incoming.iloc[::50, 1] = np.nan
+    forest = CompactForest.load(backend.compact_model_path(backend.MODEL_PATH))
+    expected = model.decision_function(scaler.transform(incoming.to_numpy()))
+    assert np.allclose(forest.decision_function(incoming.to_numpy()), expected, atol=1e-9)
+
+    backend.model_registry.invalidate()
+    misses = backend.model_registry.stats()["misses"]
+    labels = predict_anomalies(incoming, ["a", "b", "c"])
+    assert labels == ["Yes" if score < 0 else "No" for score in expected]
+    assert backend.model_registry.stats()["misses"] == misses  # the pickle was never loaded
+
+def test_profiles_and_upload_limit_across_workers(client, monkeypatch, tmp_path):
+    # Two registries over one directory stand in for two server worker processes
+    worker_a, worker_b = ProfileRegistry(str(tmp_path / "models")), ProfileRegistry(str(tmp_path / "models"))
+    worker_a.register("team-a", {"criteria_columns": ["GL Balance", "iHub Balance"]})
+    assert worker_b.names() == ["team-a"]
+    assert worker_b.get("team-a").plan.criteria_columns == ("GL Balance", "iHub Balance")
+
+    worker_a.register("team-a", {"criteria_columns": ["Ledger", "Bank"]})
+    assert worker_b.get("team-a").plan.criteria_columns == ("Ledger", "Bank")
+
+    monkeypatch.setitem(app.config, "MAX_CONTENT_LENGTH", 1024)
+    response = client.post("/reconcile", data={"file": (BytesIO(b"a\n" + b"1\n" * 1024), "big.csv")})
+    assert response.status_code == 413
+    assert "request size limit" in response.get_json()["error"]
+
+def test_metrics_endpoint_and_run_log(client, monkeypatch, tmp_path):
+    monkeypatch.setattr(backend, "MODEL_PATH", str(tmp_path / "missing.pkl"))
+    monkeypatch.setattr(backend, "config", {"criteria_columns": ["GL Balance", "iHub Balance"]})
+    monkeypatch.setattr(backend, "metrics", PipelineMetrics(str(tmp_path / "metrics")))
+    monkeypatch.setattr(backend, "ALLOW_PROFILING", True)
+    monkeypatch.setattr(backend, "PROFILES_DIR", str(tmp_path / "profiles"))
+    csv_buffer = BytesIO(b"Account,GL Balance,iHub Balance\nA,100,100\nB,200,195\n")
+
+    response = client.post("/reconcile?debug_profile=1", data={"file": (csv_buffer, "test.csv")})
+    assert response.get_json()["processed_count"] == 2
+    profile_id = response.headers["X-Profile-Id"]
+    assert (tmp_path / "profiles" / f"{profile_id}.prof").exists()
+    assert "peak" in (tmp_path / "profiles" / f"{profile_id}.txt").read_text()
+
+    with open(tmp_path / "metrics" / "runs.jsonl") as run_log:
+        run = json.loads(run_log.readline())
+    assert run["kind"] == "reconcile" and run["processed_count"] == 2
+    assert {"ingest", "coerce", "match_status", "prefilter", "serialize"} <= set(run["stages"])
+
+    exposition = client.get("/metrics").get_data(as_text=True)
+    assert 'recon_stage_seconds_count{stage="match_status"} 1' in exposition
+    assert 'recon_run_seconds_count{kind="reconcile"} 1' in exposition
+    assert "recon_rows_input_total 2" in exposition
+
+def test_metrics_survive_worker_restarts_and_rotate_the_run_log(tmp_path):
+    directory = str(tmp_path / "metrics")
+    old_worker = PipelineMetrics(directory, run_log_max_bytes=200, run_log_backups=2)
+    for _ in range(3):
+        with old_worker.run("reconcile"):
+            old_worker.increment("rows_input", 5)
+    # Pretend the worker exited: its snapshot now carries the pid of a finished process
+    exited = subprocess.Popen([sys.executable, "-c", "pass"])
+    exited.wait()
+    (snapshot_path,) = [path for path in os.listdir(directory) if path.startswith("metrics-") and path.endswith(".json")]
+    snapshot = json.loads((tmp_path / "metrics" / snapshot_path).read_text())
+    (tmp_path / "metrics" / snapshot_path).write_text(json.dumps({**snapshot, "pid": exited.pid}))
+
+    new_worker = PipelineMetrics(directory)
+    with new_worker.run("reconcile"):
+        new_worker.increment("rows_input", 1)
+    assert new_worker.collect()["counters"]["rows_input"] == 16
+    assert new_worker.collect()["runs"]["reconcile"]["count"] == 4  # folded once, not on every scrape
+    assert not (tmp_path / "metrics" / snapshot_path).exists()
+    assert (tmp_path / "metrics" / "metrics-retired.json").exists()
+
+    assert (tmp_path / "metrics" / "runs.jsonl.1").exists()
+    assert not (tmp_path / "metrics" / "runs.jsonl.3").exists()
+
+def test_synthetic_dataset_matches_schema_and_rates(tmp_path):
+    from benchmarks import make_matched_records_frame, write_synthetic_dataset
+
+    df = make_matched_records_frame(20_000, break_rate=0.1, anomaly_rate=0.01)
+    assert list(df.columns) == MATCHED_RECORDS_COLUMNS
+    assert (df["Anomaly"] == "Yes").mean() == pytest.approx(0.01, abs=0.003)
+    assert (df["Balance Difference"] != 0).mean() == pytest.approx(0.11, abs=0.01)
+    assert df.loc[df["Anomaly"] == "Yes", "Balance Difference"].abs().min() >= 20_000
+
+    write_synthetic_dataset(str(tmp_path / "data.parquet"), 2500, chunk_rows=1000)
+    assert len(read_input(str(tmp_path / "data.parquet"))) == 2500
+
+def test_reconcile_results_are_paged_filtered_and_downloadable(client, monkeypatch, tmp_path):
+    import pyarrow.ipc as ipc
+    from results import ResultStore
+
+    monkeypatch.setattr(backend, "MODEL_PATH", str(tmp_path / "missing.pkl"))
+    monkeypatch.setattr(backend, "config", {"criteria_columns": ["GL Balance", "iHub Balance"], "key_columns": ["Account"]})
+    monkeypatch.setattr(backend, "result_store", ResultStore(str(tmp_path / "results")))
+    monkeypatch.setattr(backend, "predict_anomalies", lambda df, cols, model_path=None: ["Yes"] * len(df))
+    rows = "".join(f"{'AB'[i % 2]}{i},{i},{i + 1}\n" for i in range(25))
+    csv_buffer = BytesIO(f"Account,GL Balance,iHub Balance\n{rows}".encode())
+
+    response = client.post("/reconcile", data={"file": (csv_buffer, "test.csv"), "page_size": "10"})
+    result = response.get_json()
+    assert result["anomalous_count"] == 25 and result["has_more"]
+    assert len(result["anomalous_records"]) == 10
+
+    page = client.get(f"/results/{result['result_id']}?page=3&page_size=10").get_json()
+    assert page["total_count"] == 25 and page["page_count"] == 3 and len(page["data"]) == 5
+    assert "Account" in page["columns"]
+
+    query = "filter=Account:A0&filter=Account:A2&sort=GL Balance&order=desc"
+    page = client.get(f"/results/{result['result_id']}?{query}").get_json()
+    accounts = [row[page["columns"].index("Account")] for row in page["data"]]
+    assert accounts == ["A2", "A0"]
+    assert client.get(f"/results/{result['result_id']}?filter=Nope:1").status_code == 400
+    assert client.get("/results/unknown").status_code == 404
+
+    download = client.get(f"/results/{result['result_id']}/download?format=arrow")
+    assert "attachment" in download.headers["Content-Disposition"]
+    assert ipc.open_file(BytesIO(download.data)).read_all().num_rows == 25
+
+def test_result_pages_read_only_the_parts_they_need(monkeypatch, tmp_path):
+    import results
+
+    paths = []
+    for index in range(3):
+        part = pd.DataFrame({"Account": [f"{'AB'[index % 2]}{index * 10 + i}" for i in range(10)],
+                             "Balance": [float(index * 10 + i) for i in range(10)]})
+        results.write_result_part(str(tmp_path), index, part)
+        paths.append(str(tmp_path / f"part-{index:05d}.parquet"))
+    read = []
+    read_table = results.pq.read_table
+    monkeypatch.setattr(results.pq, "read_table", lambda path, **kwargs: read.append(path) or read_table(path, **kwargs))
+
+    page, total = results.query_results(paths, page=2, page_size=8)
+    assert total == 30 and list(page["Balance"]) == [float(i) for i in range(8, 16)]
+    assert read == paths[:2]
+
+    read.clear()
+    for page_number in (1, 2):
+        page, total = results.query_results(paths, {"Account": ["A0", "A5", "A25"]}, "Balance", True,
+                                            page=page_number, page_size=2)
+    assert total == 3 and list(page["Account"]) == ["A0"]
+    assert read == paths  # the filtered, sorted table is built once and then paged from the cache
+
+def test_training_and_reconciliation_share_one_compiled_plan(monkeypatch, tmp_path):
+    monkeypatch.setattr(backend, "MODEL_PATH", str(tmp_path / "missing.pkl"))
+    monkeypatch.setattr(backend, "config", {"criteria_columns": ["Balance", "Quantity"],
+                                            "compare_current_criteria_column": False, "db_columns": "GL,iHub"})
+    profile = backend.get_profile()
+    history = pd.DataFrame({"Balance": [1, 2], "Quantity": [1, 2], " GL Balance": ["10", "x"], "iHub Balance": [7.0, 1.0],
+                            "GL Quantity": [1, 2], "iHub Quantity": [1, 2], "Notes": ["a", "b"]})
+    ledger = history["iHub Balance"].to_numpy()
+
+    assert backend.get_anamoly_columns(history, profile) == ["Difference Balance", "Difference Quantity"]
+    assert "Match Status" not in history and history["Notes"].tolist() == ["a", "b"]
+    assert np.shares_memory(history["iHub Balance"].to_numpy(), ledger)  # float64 columns are not copied
+    assert history["Difference Balance"].tolist()[0] == 3.0 and np.isnan(history["Difference Balance"].iloc[1])
+
+    frame = pd.DataFrame({"Balance": [1, 2], "Quantity": [1, 2], "GL Balance": [5.0, 6.0], "iHub Balance": [5.0, 6.0],
+                          "GL Quantity": [1, 2], "iHub Quantity": [1, 3]})
+    columns = list(frame.columns)
+    anomalous = backend.reconcile_frame(frame, profile)
+    assert profile.plan.layout(columns) is profile.plan.layout(columns)
+    assert list(frame["Match Status"]) == ["Match", "Quantity Break"]
+    assert anomalous.dtype == bool and not anomalous.any()
+
+def test_partitioned_join_reports_one_sided_breaks(monkeypatch):
+    monkeypatch.setattr(join, "MIN_PARTITIONED_ROWS", 0)
+    gl = pd.DataFrame({"Account": [1, 2, 3, 4], "Entity": ["X", "X", "Y", "Y"], "Balance": [10.0, 20.0, 30.0, 40.0]})
+    sub_ledger = pd.DataFrame({"Account": ["1", "2", "4", "5"], "Entity": ["X", "X", "Y", "Y"], "Balance": [10, 25, 40, 50]})
+
+    single = join.join_sources(gl.copy(), sub_ledger.copy(), ["Account", "Entity"], ("GL", "iHub"), partitions=1)
+    joined = join.join_sources(gl, sub_ledger, ["Account", "Entity"], ("GL", "iHub"), partitions=3)
+    assert {"GL Balance", "iHub Balance"} <= set(joined.columns) and "Balance" not in joined.columns
+
+    status = joined.set_index(joined["Account"].astype(str))["Join Status"].astype(str).to_dict()
+    assert status == {"1": "Matched", "2": "Matched", "3": "Missing in iHub", "4": "Matched", "5": "Missing in GL"}
+    pd.testing.assert_frame_equal(joined.sort_values("Account", ignore_index=True),
+                                  single.sort_values("Account", ignore_index=True))
+
+def test_join_matches_integer_keys_read_as_floats():
+    gl = pd.DataFrame({"Account": [1001, 1002, None], "Balance": [10.0, 20.0, 30.0]})
+    sub_ledger = pd.DataFrame({"Account": [1001, 1002, 1003], "Balance": [10.0, 25.0, 30.0]})
+
+    joined = join.join_sources(gl, sub_ledger, ["Account"], ("GL", "iHub"))
+    status = joined["Join Status"].astype(str).tolist()
+    assert len(joined) == 4 and status.count("Matched") == 2
+    assert sorted(status) == ["Matched", "Matched", "Missing in GL", "Missing in iHub"]
+
+    mixed = join.join_sources(pd.DataFrame({"Account": ["1001", "X"], "Balance": [1.0, 2.0]}),
+                              pd.DataFrame({"Account": [1001.0, 5.0], "Balance": [1.0, 2.0]}), ["Account"], ("GL", "iHub"))
+    assert mixed.set_index("Account")["Join Status"].astype(str).to_dict() == {
+        "1001": "Matched", "5": "Missing in GL", "X": "Missing in iHub"}
+
+def test_join_rejects_duplicate_keys(client, monkeypatch, tmp_path):
+    gl = pd.DataFrame({"Account": [1, 2, 2], "Balance": [10.0, 20.0, 21.0]})
+    sub_ledger = pd.DataFrame({"Account": [1, 2], "Balance": [10.0, 20.0]})
+    with pytest.raises(join.DuplicateKeysError, match="GL source has 2 rows"):
+        join.join_sources(gl, sub_ledger, ["Account"], ("GL", "iHub"))
+
+    monkeypatch.setattr(backend, "MODEL_PATH", str(tmp_path / "missing.pkl"))
+    monkeypatch.setattr(backend, "config", {"criteria_columns": ["Balance"], "key_columns": ["Account"],
+                                            "compare_current_criteria_column": False, "db_columns": "GL,iHub"})
+    response = client.post("/reconcile", data={"file": (BytesIO(b"Account,Balance\nA,1\nA,2\n"), "gl.csv"),
+                                               "counterpart_file": (BytesIO(b"Account,Balance\nA,1\n"), "ihub.csv")})
+    assert response.status_code == 400 and "each key must appear once" in response.get_json()["error"]
+
+def test_reconcile_two_sources(client, monkeypatch, tmp_path):
+    monkeypatch.setattr(backend, "MODEL_PATH", str(tmp_path / "missing.pkl"))
+    monkeypatch.setattr(backend, "config", {"criteria_columns": ["Balance"], "key_columns": ["Account"],
+                                            "compare_current_criteria_column": False, "db_columns": "GL,iHub"})
+    monkeypatch.setattr(backend, "result_store", backend.ResultStore(str(tmp_path / "results")))
+    gl = BytesIO(b"Account,Balance\nA,100\nB,200\nC,300\n")
+    sub_ledger = BytesIO(b"Account,Balance\nA,100\nB,200\nD,50\n")
+
+    response = client.post("/reconcile", data={"file": (gl, "gl.csv"), "counterpart_file": (sub_ledger, "ihub.csv")})
+    result = response.get_json()
+    assert result["processed_count"] == 4
+    assert result["stage_counts"]["one_sided"] == 2 and result["stage_counts"]["exact_match"] == 2
+    assert sorted(record["Join Status"] for record in result["anomalous_records"]) == ["Missing in GL", "Missing in iHub"]
+
+def test_identical_reconcile_requests_reuse_the_stored_result(client, monkeypatch, tmp_path):
+    monkeypatch.setattr(backend, "MODEL_PATH", str(tmp_path / "missing.pkl"))
+    monkeypatch.setattr(backend, "config", {"criteria_columns": ["GL Balance", "iHub Balance"]})
+    monkeypatch.setattr(backend, "result_store", backend.ResultStore(str(tmp_path / "results")))
+    scored = []
+    monkeypatch.setattr(backend, "predict_anomalies",
+                        lambda df, cols, model_path=None: scored.append(len(df)) or ["Yes"] * len(df))
+    comments = ["Smaller than usual", "Larger than usual"]
+    monkeypatch.setattr(backend, "generate_comments", lambda prompt, values, history: comments[:len(values)])
+    upload = b"Account,GL Balance,iHub Balance\nA,100,90\nB,200,195\n"
+
+    first = client.post("/reconcile", data={"file": (BytesIO(upload), "a.csv")}).get_json()
+    second = client.post("/reconcile", data={"file": (BytesIO(upload), "renamed.csv")}).get_json()
+    assert second["cached"] and not first["cached"]
+    assert second["result_id"] == first["result_id"] and second["anomalous_records"] == first["anomalous_records"]
+    assert second["stage_counts"] == first["stage_counts"] and scored == [2]
+
+    monkeypatch.setitem(backend.config, "comment_prompt", "Explain the break")
+    comments[0] = backend.FALLBACK_COMMENT
+    third = client.post("/reconcile", data={"file": (BytesIO(upload), "a.csv")}).get_json()
+    assert not third["cached"] and scored == [2, 2] and third["stage_counts"]["comment_fallbacks"] == 1
+
+    # A result with fallback comments is not reused; once every comment came back, it is
+    comments[0] = "Smaller than usual"
+    fourth = client.post("/reconcile", data={"file": (BytesIO(upload), "a.csv")}).get_json()
+    fifth = client.post("/reconcile", data={"file": (BytesIO(upload), "a.csv")}).get_json()
+    assert not fourth["cached"] and fifth["cached"] and scored == [2, 2, 2]
+    assert "comment_fallbacks" not in fourth["stage_counts"]
+
+def test_result_store_evicts_by_size_and_age(tmp_path):
+    from results import ResultStore
+
+    frame = pd.DataFrame({"value": np.arange(1000.0)})
+    store = ResultStore(str(tmp_path), max_age_seconds=3600, max_bytes=1)
+    oldest = store.save(frame, "a" * 64, {"anomalous_count": 1000})
+    os.utime(store.path(oldest), (time.time() - 60, time.time() - 60))
+    newest = store.save(frame, "b" * 64, {"anomalous_count": 1000})
+    assert store.path(oldest) is None and store.lookup("a" * 64) is None
+    assert store.lookup("b" * 64) == (newest, {"anomalous_count": 1000})
+
+    # A hit refreshes the index entry too, so purging by age keeps keys that are still in use
+    index_path = os.path.join(store.index.directory, "b" * 64)
+    os.utime(index_path, (time.time() - 7200, time.time() - 7200))
+    assert store.lookup("b" * 64) is not None
+    store.index.purge(3600)
+    assert os.path.exists(index_path)
+
+    store.max_bytes = None
+    os.utime(store.path(newest), (time.time() - 7200, time.time() - 7200))
+    store.purge()
+    assert store.path(newest) is None
+
+def test_llm_client_batches_prompts_and_retries_only_failed_rows(fake_ollama):
+    client = AsyncLLMClient("mistral", host=fake_ollama.url, retries=2, backoff=0.01, max_batch_size=4)
+    prompts = ["a", "flaky", "b", "fail", "c", "d"]
+
+    assert client.chat_batched(prompts) == ["comment for a", "comment for flaky", "comment for b", None,
+                                            "comment for c", "comment for d"]
+    # Two batches of four and two (sent concurrently), then the unanswered rows again in halved batches
+    assert sorted(fake_ollama.batches[:2]) == [["a", "flaky", "b", "fail"], ["c", "d"]]
+    assert fake_ollama.batches[2:] == [["flaky", "fail"], ["fail"]]
+
+    small_context = AsyncLLMClient("mistral", max_batch_size=50, context_length=1000, answer_tokens=100)
+    assert small_context.batch_size(["x" * 400]) == 4
+    assert small_context.batch_size(["x" * 8000]) == 1
+
+def test_action_code_is_prewarmed_cached_and_invalidated(client, monkeypatch, tmp_path, fake_ollama):
+    monkeypatch.setattr(backend, "profile_registry", ProfileRegistry(str(tmp_path / "models")))
+    monkeypatch.setattr(backend, "llm_client", AsyncLLMClient("mistral", host=fake_ollama.url))
+    team_config = {"criteria_columns": ["GL Balance", "iHub Balance"], "next_step_options": {"1": "Send an Email"}}
+    client.post("/load/config", data={"config_file": (BytesIO(json.dumps(team_config).encode()), "config.json"),
+                                      "profile": "team"})
+    actions_path = backend.get_profile("team").actions_path
+    deadline = time.monotonic() + 5
+    while not os.path.exists(actions_path) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert len(fake_ollama.prompts) == 1
+
+    selected = client.post("/chat/select", json={"option": "1", "profile": "team"}).get_json()
+    assert selected["cached"] and "send an email" in selected["generated_code"]
+    assert len(fake_ollama.prompts) == 1
+
+    # Renaming the option invalidates its code; the next selection generates it once and caches it again
+    team_config["next_step_options"]["1"] = "Create a Jira Ticket"
+    backend.profile_registry.register("team", team_config)
+    assert not client.post("/chat/select", json={"option": "1", "profile": "team"}).get_json()["cached"]
+    assert client.post("/chat/select", json={"option": "1", "profile": "team"}).get_json()["cached"]
+    assert len(fake_ollama.prompts) == 2 and "create a jira ticket" in fake_ollama.prompts[-1]
+
+def test_batch_cli_writes_partitioned_outputs_per_file(tmp_path, capsys):
+    import batch
+
+    inputs = tmp_path / "inputs"
+    inputs.mkdir()
+    (inputs / "east.csv").write_text("Account,GL Balance,iHub Balance\nA,100,100\nB,200,90\nC,300,300\n")
+    (inputs / "west.csv").write_text("Account,GL Balance,iHub Balance\nD,50,50\n")
+    (inputs / "README.md").write_text("not an input")
+    config_path = tmp_path / "config.json"
+    config_path.write_text(json.dumps({"criteria_columns": ["Balance"], "key_columns": ["Account"],
+                                       "compare_current_criteria_column": False, "db_columns": "GL,iHub"}))
+    output = tmp_path / "out"
+
+    argv = [str(inputs), "--config", str(config_path), "--output", str(output),
+            "--model", str(tmp_path / "missing.pkl"), "--workers", "2", "--chunk-size", "2"]
+    assert batch.main(argv) == 0
+    assert "2 files (0 failed), 4 rows" in capsys.readouterr().out
+
+    summary = {os.path.basename(f["file"]): f for f in json.loads((output / "summary.json").read_text())["files"]}
+    assert summary["east.csv"]["rows"] == 3 and summary["west.csv"]["rows"] == 1
+    assert summary["east.csv"]["seconds"] > 0 and "prefilter" in summary["east.csv"]["stages"]
+    # Without a model B is scored "Unknown"; it is not anomalous, so it goes with the matched rows
+    matched = pd.read_parquet(output / "matched")  # hive partitions become the "source" column
+    assert sorted(zip(matched["source"].astype(str), matched["Account"], matched["Anomaly"])) == [
+        ("east", "A", "No"), ("east", "B", "Unknown"), ("east", "C", "No"), ("west", "D", "No")]
+
+    assert batch.main(argv) == 0  # a rerun replaces the earlier output
+    assert len(pd.read_parquet(output / "matched")) == 4
+
+    # The batch keeps its baselines with its output; the model's own are left alone
+    assert (output / "baselines.parquet").exists() and not (tmp_path / "baselines.parquet").exists()
+    (output / "baselines.parquet").unlink()
+    assert batch.main(argv + ["--no-baseline-update"]) == 0
+    assert not (output / "baselines.parquet").exists()
+
+def test_batch_splits_llm_concurrency_between_workers(monkeypatch, tmp_path):
+    import batch
+    import concurrent.futures
+
+    pools = []
+    class RecordingPool:
+        def __init__(self, max_workers, mp_context, initializer, initargs):
+            pools.append((max_workers, initargs))
+        def __enter__(self):
+            return self
+        def __exit__(self, *exc):
+            return False
+        def submit(self, function, path, *args):
+            future = concurrent.futures.Future()
+            future.set_result({"status": "ok", "file": path, "seconds": 0.0})
+            return future
+    monkeypatch.setattr(batch.concurrent.futures, "ProcessPoolExecutor", RecordingPool)
+    profile = backend.get_profile()
+
+    batch.run_batch([], profile, str(tmp_path), workers=4, llm_concurrency=10)
+    batch.run_batch(["a.csv", "b.csv", "c.csv"], profile, str(tmp_path), workers=2, llm_concurrency=5,
+                    update_baselines=False)
+    assert pools == [(1, (profile, True, 10)), (2, (profile, False, 2))]